@@ -45,8 +45,11 @@ def get_config():
                         help="Select the ePaper display model")
     parser.add_argument("--simulator", action="store_true",
                         help="Use the EPD Emulator instead of a real ePaper display")
+    parser.add_argument("--image", default=None,
+                        help="Display this image file instead of picking one from the image source")
 
-    args = parser.parse_args()
+    # Unknown flags belong to whichever script imported the config (e.g. epaper_agent.py --once)
+    args, _ = parser.parse_known_args()
 
     # Determine if using the simulator
     use_simulator = args.simulator or os.getenv("USE_SIMULATOR", "false").lower() == "true"
@@ -54,28 +57,56 @@ def get_config():
     # Ensure Tkinter mode is correctly loaded
     use_tkinter = os.getenv("USE_TKINTER", "false").lower() == "true"
 
+    # "image": the emulator takes PIL images directly; "spi": the real Waveshare driver runs on an emulated SPI bus
+    simulator_backend = os.getenv("SIMULATOR_BACKEND", "image").lower()
+
+    # Emulated refresh time: 0 = instant, 1 = as slow as the real panel, N = N times faster
+    emulator_clock_speed = float(os.getenv("EMULATOR_CLOCK_SPEED", 0))
+
+    # Headless emulator: no window or web server, each frame goes to a sink (memory, png:<dir>, strip:<file>)
+    emulator_headless = os.getenv("EMULATOR_HEADLESS", "false").lower() == "true"
+
     # Ensure Shutdown mode is correctly loaded
     shutdown_after_run = os.getenv("SHUTDOWN_AFTER_RUN", "false").lower() == "true"
 
-    # Automatically adjust display key based on simulator mode
-    if use_simulator and args.display == "epd5in65f":
+    # Automatically adjust display key based on simulator mode (the SPI emulator runs the real driver)
+    if use_simulator and simulator_backend == "image" and args.display == "epd5in65f":
         display_model = "epd5in65"  # Use emulator key
-    elif not use_simulator and args.display == "epd5in65":
+    elif (not use_simulator or simulator_backend == "spi") and args.display == "epd5in65":
         display_model = "epd5in65f"  # Use real ePaper key
     else:
         display_model = args.display
 
+    # Persistent state (Drive manifest, image mirror, ...) lives here between wakes
+    cache_dir = os.getenv("CACHE_DIR", "/mnt/photos/.epaper_cache")
+
     return {
         "IMAGE_SOURCE": args.source,
+        "IMAGE_PATH": args.image,
         "DISPLAY_MODEL": display_model,
         "TARGET_SIZE": EPD_SCREENS[display_model],
         "USE_SIMULATOR": use_simulator,
         "USE_TKINTER": use_tkinter,
+        "SIMULATOR_BACKEND": simulator_backend,
+        "EMULATOR_CLOCK_SPEED": emulator_clock_speed,
+        "EMULATOR_HEADLESS": emulator_headless,
+        "EMULATOR_SINK": os.getenv("EMULATOR_SINK", "memory"),
+        "EMULATOR_PORT": int(os.getenv("EMULATOR_PORT", 5000)),
         "SHUTDOWN_AFTER_RUN": shutdown_after_run,
         "LOCAL_IMAGE_DIR": os.getenv("LOCAL_IMAGE_DIR", "/mnt/photos"),
+        "FAVORITES_FILE": os.getenv("FAVORITES_FILE", "/mnt/photos/favorites.txt"),
         "DRIVE_FOLDER_ID": os.getenv("GOOGLE_DRIVE_FOLDER_ID"),
         "SERVICE_ACCOUNT_FILE": os.getenv("GOOGLE_SERVICE_ACCOUNT"),
         "DRIVE_LOGS_FOLDER_ID": os.getenv("GOOGLE_DRIVE_LOG_FOLDER_ID"),
+        "DRIVE_API_ENDPOINT": os.getenv("DRIVE_API_ENDPOINT"),  # Point at a local HTTP stand-in for testing
+        "CACHE_DIR": cache_dir,
+        "MIRROR_DIR": os.getenv("MIRROR_DIR", os.path.join(cache_dir, "mirror")),
+        "NETWORK_PROBE_TIMEOUT": float(os.getenv("NETWORK_PROBE_TIMEOUT", 1.0)),
+        "DRIVE_FETCH_TIMEOUT": float(os.getenv("DRIVE_FETCH_TIMEOUT", 60)),
+        "DRIVE_FETCH_ORIGINAL": os.getenv("DRIVE_FETCH_ORIGINAL", "false").lower() == "true",
+        "DRIVE_CHUNK_SIZE": int(os.getenv("DRIVE_CHUNK_KB", 256)) * 1024,
+        "DRIVE_DOWNLOAD_WORKERS": int(os.getenv("DRIVE_DOWNLOAD_WORKERS", 2)),
+        "MIRROR_MAX_BYTES": int(os.getenv("MIRROR_MAX_MB", 512)) * 1024 * 1024,
         "MQTT_BROKER": os.getenv("MQTT_BROKER", "homeassistant.local"),
         "MQTT_PORT": int(os.getenv("MQTT_PORT", 1883)),
         "MQTT_TOPIC_PREFIX": os.getenv("MQTT_TOPIC_PREFIX", "epaper_frame"),
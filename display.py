@@ -1,42 +1,144 @@
 import time
+import timing
+imports_started = time.time()
 import importlib
 import io
+import logging
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageOps
 from config import CONFIG
 from image_source import get_random_image
 import os
 import mqtt_update
+import energy
+import wake_log
+timing.record("imports", imports_started, time.time() - imports_started)
+
+# The ePaper driver instance, created on first use so importing this module stays cheap
+epd = None
+# In simulator mode, the emulator behind it (frame sink, emulated clock); the same object as `epd` for the image backend
+emulator = None
+# True from prepare_display() until sleep_panel()
+panel_awake = False
+# A refresh started by render(wait=False), running on the panel thread until wait_for_refresh()
+refresh_future = None
+panel_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="panel")
+
+def uses_image_emulator():
+    """True when the emulator is fed PIL images directly instead of driver buffers."""
+    return CONFIG["USE_SIMULATOR"] and CONFIG["SIMULATOR_BACKEND"] != "spi"
+
+def emulator_options():
+    """Keyword arguments shared by both emulator backends: headless recording and the web port."""
+    from epd_emulator.frame_sinks import make_sink
+    headless = CONFIG["EMULATOR_HEADLESS"]
+    return {
+        "headless": headless,
+        "frame_sink": make_sink(CONFIG["EMULATOR_SINK"]) if headless else None,
+        "port": CONFIG["EMULATOR_PORT"],
+        "clock_speed": CONFIG["EMULATOR_CLOCK_SPEED"],
+    }
+
+def create_epd():
+    """Create the emulator or the real Waveshare driver for the configured display model."""
+    global emulator
+    if CONFIG["USE_SIMULATOR"] and CONFIG["SIMULATOR_BACKEND"] == "spi":
+        from epd_emulator import epdemulator, spi_backend
+        print(f"📡 Using {CONFIG['DISPLAY_MODEL']} driver on the SPI-level EPD Emulator")
+        viewer = epdemulator.EPD(
+            size=CONFIG["TARGET_SIZE"],
+            use_tkinter=CONFIG["USE_TKINTER"],
+            use_color=True,
+            update_interval=5,
+            **emulator_options()
+        )
+        # The driver's command/data bytes are decoded into the frame the panel would show,
+        # with BUSY held for as long as the real panel's refresh takes (on the emulated clock)
+        driver, bus = spi_backend.install(CONFIG["DISPLAY_MODEL"], on_frame=viewer.show_frame,
+                                          clock_speed=CONFIG["EMULATOR_CLOCK_SPEED"])
+        viewer.clock = bus.clock  # One emulated clock: the panel's
+        emulator = viewer
+        timing.instrument_epd(driver)
+        return driver
+
+    if CONFIG["USE_SIMULATOR"]:
+        from epd_emulator import epdemulator
+        USE_TKINTER = CONFIG["USE_TKINTER"]
+        mode = "Headless" if CONFIG["EMULATOR_HEADLESS"] else "Tkinter" if USE_TKINTER else "Flask"
+
+        print(f"📡 Using EPD Emulator ({mode} Mode)")
+        emulator = epdemulator.EPD(
+            config_file=CONFIG["DISPLAY_MODEL"],
+            use_tkinter=USE_TKINTER,
+            use_color=True,
+            update_interval=5,
+            reverse_orientation=False,
+            **emulator_options()
+        )
+        return emulator
 
-# Import appropriate ePaper display driver dynamically
-if CONFIG["USE_SIMULATOR"]:
-    from epd_emulator import epdemulator
-    USE_TKINTER = CONFIG["USE_TKINTER"]  
-
-    print(f"📡 Using EPD Emulator ({'Tkinter' if USE_TKINTER else 'Flask'} Mode)")
-    epd = epdemulator.EPD(
-        config_file=CONFIG["DISPLAY_MODEL"],
-        use_tkinter=USE_TKINTER,
-        use_color=True,
-        update_interval=5,
-        reverse_orientation=False
-    )
-else:
     print(f"📡 Using real Waveshare ePaper display: {CONFIG['DISPLAY_MODEL']}")
     epd_module = importlib.import_module(f"waveshare_epd.{CONFIG['DISPLAY_MODEL']}")
-    epd = epd_module.EPD()
+    driver = epd_module.EPD()
+    timing.instrument_epd(driver)  # Time each BUSY wait and SPI transfer
+    return driver
+
+def prepare_display():
+    """Create the driver if needed, then initialize and clear the panel."""
+    global epd, panel_awake
+    wait_for_refresh()  # The panel can't take new commands until the previous refresh is done
+    if epd is None:
+        epd = create_epd()
+
+    # Initialize ePaper display (again after sleep_panel(): the driver's sleep closes SPI and GPIO)
+    print("✅ Initializing EPD Display...")
+    with timing.span("panel_init"):
+        epd.init()
+    panel_awake = True
 
-# Initialize ePaper display
-print("✅ Initializing EPD Display...")
-epd.init()
+    # Correct the `Clear()` call based on simulator or real hardware
+    with timing.span("panel_clear"):
+        if uses_image_emulator():
+            epd.Clear(255)  # Simulator requires a color argument
+        else:
+            epd.Clear()  # Real Waveshare displays take no arguments
+
+    print("✅ EPD Display Cleared")
+    return epd
 
-# Correct the `Clear()` call based on simulator or real hardware
-if CONFIG["USE_SIMULATOR"]:
-    epd.Clear(255)  # Simulator requires a color argument
-else:
-    epd.Clear()  # Real Waveshare displays take no arguments
+def sleep_panel():
+    """Put the panel into deep sleep after a refresh, as Waveshare drivers require. Does nothing if it already sleeps."""
+    global panel_awake
+    wait_for_refresh()
+    if epd is None or not panel_awake:
+        return
+    epd.sleep()
+    panel_awake = False
 
-print("✅ EPD Display Cleared")
+def refresh(frame, wait=True):
+    """Send a frame to the panel with the driver's display(): data transfer, refresh command and BUSY wait.
+
+    With `wait=False` it runs on the panel thread and this returns at once; see wait_for_refresh().
+    """
+    global refresh_future
+
+    def show():
+        with timing.span("panel_refresh"):
+            epd.display(frame)
+
+    if wait:
+        show()
+    else:
+        refresh_future = panel_executor.submit(show)
+
+def wait_for_refresh():
+    """Wait until a refresh started with render(wait=False) has finished. Returns True, or raises its error."""
+    global refresh_future
+    future, refresh_future = refresh_future, None
+    if future is not None:
+        future.result()
+    return True
 
 # Define 7-color palette
 palette_image = Image.new("P", (1, 1))
@@ -68,97 +170,114 @@ def preprocess_image(image_data):
 
     print(f"📏 Original Image Size: {img.size}, Mode: {img.mode}")
 
-    if img.mode in ('RGBA', 'LA'):
-        print("🎨 Converting RGBA/LA Image to RGB")
-        background = Image.new("RGB", img.size, (255, 255, 255))
-        background.paste(img, mask=img.split()[3])
-        img = background
-    else:
-        img = img.convert("RGB")
+    # Image.open() only reads the header; pixels are decoded by the first conversion
+    with timing.span("decode"):
+        if img.mode in ('RGBA', 'LA'):
+            print("🎨 Converting RGBA/LA Image to RGB")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.split()[3])
+            img = background
+        else:
+            img = img.convert("RGB")
+
+        img = ImageOps.exif_transpose(img)
 
-    img = ImageOps.exif_transpose(img)
+    with timing.span("resize"):
+        # Rotate for better fit
+        w, h = img.size
+        target_w, target_h = CONFIG["TARGET_SIZE"]
+        scale_normal = min(target_w / w, target_h / h)
+        scale_rotated = min(target_w / h, target_h / w)
 
-    # Rotate for better fit
-    w, h = img.size
-    target_w, target_h = CONFIG["TARGET_SIZE"]
-    scale_normal = min(target_w / w, target_h / h)
-    scale_rotated = min(target_w / h, target_h / w)
+        if scale_rotated > scale_normal:
+            print("🔄 Rotating Image for Better Fit")
+            img = img.rotate(90, expand=True)
 
-    if scale_rotated > scale_normal:
-        print("🔄 Rotating Image for Better Fit")
-        img = img.rotate(90, expand=True)
+        img = ImageOps.pad(img, CONFIG["TARGET_SIZE"], color=(255, 255, 255))
 
-    img = ImageOps.pad(img, CONFIG["TARGET_SIZE"], color=(255, 255, 255))
-    img = img.quantize(palette=palette_image)
+    with timing.span("quantize"):
+        img = img.quantize(palette=palette_image)
 
     print(f"✅ Image Processed. Final Size: {img.size}")
     return img
 
-LOG_FILE = "/mnt/photos/epaper_logs.txt"
-
-
 def log_displayed_image(image_path):
-    """Overwrite the last displayed image entry in the log file, preserving spaces."""
-    log_lines = []
-
-    # Read existing log file, excluding previous "Last Image Displayed" entries
-    if os.path.exists(LOG_FILE):
-        with open(LOG_FILE, "r") as log_file:
-            log_lines = [line for line in log_file if "🖼️ Last Image Displayed:" not in line]
+    """Note the displayed image in the wake log (MQTT `last_image` carries it to Home Assistant)."""
+    logging.info(f"🖼️ Last Image Displayed: \"{image_path}\"")  # ✅ Preserve spaces
 
-    # Append new last image entry with full filename
-    log_lines.append(f"🖼️ Last Image Displayed: \"{image_path}\"\n")  # ✅ Preserve spaces
 
-    # Overwrite log file with the updated list
-    with open(LOG_FILE, "w") as log_file:
-        log_file.writelines(log_lines)
+def render(image_data, image_title, publish=True, wait=True):
+    """Process an image and show it on the panel. Returns True once the panel has been updated.
 
-    print(f"🖼️ Last Image Updated: {image_path}")
-
-
-def main():
-    """Main function to handle image selection, processing, and display."""
-    print(f"📺 Using Display: {CONFIG['DISPLAY_MODEL']}, Resolution: {CONFIG['TARGET_SIZE']}, Simulator: {CONFIG['USE_SIMULATOR']}")
-
-    image_data, image_title = get_random_image()
-    if image_data is None:
-        print("❌ No image to display. Exiting.")
-        return
-    
+    `publish=False` skips the MQTT `last_image` update (benchmarks measure the display pipeline alone).
+    `wait=False` returns as soon as the refresh has started, so other work can overlap the panel's
+    BUSY wait (30 s on ACeP); wait_for_refresh() or sleep_panel() wait for it to finish.
+    """
     # Publish MQTT update with the image title
-    try:
-        mqtt_update.publish_mqtt("last_image", image_title)
-        print(f"🖼️ Published MQTT update for last_image: {image_title}")
-    except Exception as e:
-        print(f"❌ Failed to publish MQTT update: {e}")
+    if publish:
+        try:
+            mqtt_update.publish_mqtt("last_image", image_title)
+            print(f"🖼️ Published MQTT update for last_image: {image_title}")
+        except Exception as e:
+            print(f"❌ Failed to publish MQTT update: {e}")
 
     img = preprocess_image(image_data)
     if img is None:
         print("❌ Failed to preprocess image. Exiting.")
-        return
+        return False
+
+    prepare_display()
 
     # Convert the processed image into the display buffer
-    if CONFIG["USE_SIMULATOR"]:
+    if uses_image_emulator():
         print("🔄 Pasting Image onto EPD Emulator...")
         epd.paste_image(img, (0, 0, CONFIG["TARGET_SIZE"][0], CONFIG["TARGET_SIZE"][1]))
         print("📡 Displaying Image on Emulator...")
-        epd.display(img)
-        print("✅ Emulator Updated.")
+        refresh(img, wait)
     else:
         print("📡 Displaying Image on Real EPD Display...")
-        buffer = epd.getbuffer(img)
-        epd.display(buffer)
-
-    # Shutdown logic with SSH failsafe
-    if CONFIG["SHUTDOWN_AFTER_RUN"]:
-        if check_ssh_sessions():
-            print("🚨 Active SSH session detected! Preventing shutdown.")
-            print("🔄 System will remain ON for maintenance.")
+        with timing.span("pack"):
+            buffer = epd.getbuffer(img)
+        refresh(buffer, wait)
+
+    log_displayed_image(image_title)
+    return True
+
+def select_image(image_path=None):
+    """Return (image_data, image_title) for an explicit image path, or the next image from the configured source."""
+    if image_path:
+        if not os.path.exists(image_path):
+            print(f"❌ Image not found: {image_path}")
+            return None, None
+        return image_path, os.path.basename(image_path)
+    return get_random_image()
+
+def main():
+    """Main function to handle image selection, processing, and display."""
+    print(f"📺 Using Display: {CONFIG['DISPLAY_MODEL']}, Resolution: {CONFIG['TARGET_SIZE']}, Simulator: {CONFIG['USE_SIMULATOR']}")
+
+    # Battery draw is sampled for the whole run, and charged to whichever span (download, decode, refresh...) was running
+    with energy.measure("refresh"):
+        image_data, image_title = select_image(CONFIG["IMAGE_PATH"])
+        if image_data is None:
+            print("❌ No image to display. Exiting.")
+            return
+
+        if not render(image_data, image_title):
+            return
+
+        # Shutdown logic with SSH failsafe
+        if CONFIG["SHUTDOWN_AFTER_RUN"]:
+            if check_ssh_sessions():
+                print("🚨 Active SSH session detected! Preventing shutdown.")
+                print("🔄 System will remain ON for maintenance.")
+            else:
+                print("⏳ Scheduling Shutdown in 5 Minutes. To cancel, run: sudo shutdown -c")
+                subprocess.call(["sudo", "shutdown", "-h", "+1"])
         else:
-            print("⏳ Scheduling Shutdown in 5 Minutes. To cancel, run: sudo shutdown -c")
-            subprocess.call(["sudo", "shutdown", "-h", "+1"])
-    else:
-        print("🟢 SHUTDOWN_AFTER_RUN is disabled. Display will remain on.")
+            print("🟢 SHUTDOWN_AFTER_RUN is disabled. Display will remain on.")
 
 if __name__ == "__main__":
+    # Standalone runs write to the same log as a wake
+    wake_log.setup(CONFIG["LOG_FILE"])
     main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import socket
+import logging
+import threading
+import socketserver
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+
+# ✅ Local socket the resident display service listens on
+DISPLAY_SOCKET = os.getenv("DISPLAY_SOCKET", "/tmp/epaper_display.sock")
+
+# Panel refreshes take up to ~30s on ACeP displays; allow for a fetch on top of that
+REQUEST_TIMEOUT = 180
+
+# Only one render may drive the panel at a time
+_render_lock = threading.Lock()
+
+
+def render_request(image_path=None):
+    """Render one image in this process (the display module and its warm state are imported on first use),
+    then put the panel to sleep.
+
+    Returns a result dict suitable for sending back to the requester.
+    """
+    import display
+    import image_source
+    import energy
+
+    with _render_lock, energy.measure("refresh"):
+        started = time.monotonic()
+        image_source.reset_network_state()  # The network may have changed since the last render
+
+        image_data, image_title = display.select_image(image_path)
+        if image_data is None:
+            return {"ok": False, "error": "No image to display."}
+        try:
+            if not display.render(image_data, image_title):
+                return {"ok": False, "error": f"Failed to render {image_title}."}
+        finally:
+            # Don't leave the panel powered until the next request; the next render runs init() again
+            display.sleep_panel()
+
+        return {"ok": True, "image": image_title, "seconds": round(time.monotonic() - started, 2)}
+
+
+class DisplayRequestHandler(socketserver.StreamRequestHandler):
+    """Handle one JSON request line, e.g. {"action": "display"} or {"action": "display", "image": "/mnt/photos/x.jpg"}."""
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode("utf-8"))
+            if request.get("action") != "display":
+                result = {"ok": False, "error": f"Unknown action: {request.get('action')}"}
+            else:
+                logging.info(f"📥 Render request: {request}")
+                result = render_request(request.get("image"))
+        except Exception as e:
+            logging.error(f"❌ Render request failed: {e}")
+            result = {"ok": False, "error": str(e)}
+
+        logging.info(f"📤 Render result: {result}")
+        self.wfile.write((json.dumps(result) + "\n").encode("utf-8"))
+
+
+def request_display(image_path=None, timeout=REQUEST_TIMEOUT):
+    """Ask a running display service to render an image.
+
+    Returns the service's result dict, or None if no service is listening (callers fall back to display.py).
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(DISPLAY_SOCKET)
+            client.sendall((json.dumps({"action": "display", "image": image_path}) + "\n").encode("utf-8"))
+            response = client.makefile("rb").readline()
+            return json.loads(response.decode("utf-8")) if response else None
+    except (FileNotFoundError, ConnectionRefusedError):
+        return None
+
+
+def serve():
+    """Keep the driver, Drive session and caches warm and render requests from the local socket."""
+    # Import the heavy modules up front so the first request doesn't pay for them
+    import display
+
+    if os.path.exists(DISPLAY_SOCKET):
+        os.remove(DISPLAY_SOCKET)  # Left over from a previous run
+
+    # Requests are handled one at a time, in arrival order
+    with socketserver.UnixStreamServer(DISPLAY_SOCKET, DisplayRequestHandler) as server:
+        logging.info(f"📺 Display service ready on {DISPLAY_SOCKET} (display: {display.CONFIG['DISPLAY_MODEL']})")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    try:
+        serve()
+    except KeyboardInterrupt:
+        logging.info("🛑 Display service stopped by user.")
@@ -0,0 +1,127 @@
+import os
+import re
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from config import CONFIG
+from drive_session import get_drive_session
+
+# Attempts per range request before the download is abandoned (the partial file is kept for next wake)
+MAX_RETRIES = 4
+RETRY_BACKOFF = 1.5  # seconds, doubled after every failed attempt
+
+# Only split downloads into parallel ranges when they are big enough to benefit
+PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+
+
+class DownloadCancelled(Exception):
+    """The download was told to stop (it lost the source race); its `.part` file is kept for a later resume."""
+
+
+def check_cancelled(cancel):
+    """Raise DownloadCancelled if the `cancel` event (a threading.Event, or None) has been set."""
+    if cancel is not None and cancel.is_set():
+        raise DownloadCancelled("download cancelled")
+
+
+def _request_range(http, uri, start, end, cancel=None):
+    """Fetch bytes [start, end] of a media URL, retrying transient failures.
+
+    Returns (content, total_size); total_size is None if the server didn't say.
+    """
+    delay = RETRY_BACKOFF
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            response, content = http.request(uri, headers={"Range": f"bytes={start}-{end}"})
+            if response.status == 416:  # Nothing left past `start`
+                return b"", start
+            if response.status == 200:  # Server ignored the range and sent everything
+                return content[start:end + 1], len(content)
+            if response.status != 206:
+                raise IOError(f"HTTP {response.status}")
+
+            match = re.match(r"bytes \d+-\d+/(\d+)", response.get("content-range", ""))
+            return content, int(match.group(1)) if match else None
+        except Exception as e:
+            if attempt == MAX_RETRIES:
+                raise
+            logging.warning(f"⚠ Range {start}-{end} failed ({e}). Retry {attempt}/{MAX_RETRIES - 1} in {delay:.1f}s")
+            time.sleep(delay)
+            check_cancelled(cancel)
+            delay *= 2
+
+
+def _download_range(http, uri, part_path, start=0, end=None, cancel=None):
+    """Download bytes [start, end] of a media URL into `part_path`, resuming from whatever is already on disk.
+
+    `end` is inclusive; None means "to the end of the file". `cancel` is checked before every chunk.
+    Returns the number of bytes transferred.
+    """
+    chunk_size = CONFIG["DRIVE_CHUNK_SIZE"]
+    offset = start + (os.path.getsize(part_path) if os.path.exists(part_path) else 0)
+    transferred = 0
+
+    with open(part_path, "ab") as part_file:
+        while end is None or offset <= end:
+            chunk_end = offset + chunk_size - 1 if end is None else min(offset + chunk_size - 1, end)
+            requested = chunk_end - offset + 1
+            check_cancelled(cancel)
+            content, total_size = _request_range(http, uri, offset, chunk_end, cancel)
+            if end is None and total_size is not None:
+                end = total_size - 1
+            if not content:
+                break
+
+            part_file.write(content)
+            part_file.flush()  # Keep on-disk progress current in case the next chunk fails
+            offset += len(content)
+            transferred += len(content)
+
+            if end is None and len(content) < requested:
+                break  # Short read with no known size: that was the last chunk
+
+    return transferred
+
+
+def _download_segment(uri, part_path, start, end, cancel=None):
+    """Download one byte range of a parallel download into its own resumable segment file."""
+    # httplib2 connections aren't thread-safe, so each worker gets its own
+    http = get_drive_session().new_http()
+    return _download_range(http, uri, f"{part_path}.{start}-{end}", start, end, cancel)
+
+
+def _download_parallel(uri, part_path, total_size, workers, cancel=None):
+    """Split the file into `workers` ranges, download them concurrently and stitch them together."""
+    segment_size = -(-total_size // workers)  # Ceiling division
+    segments = [
+        (start, min(start + segment_size, total_size) - 1)
+        for start in range(0, total_size, segment_size)
+    ]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        transferred = sum(executor.map(lambda segment: _download_segment(uri, part_path, *segment, cancel), segments))
+
+    with open(part_path, "wb") as part_file:
+        for start, end in segments:
+            segment_path = f"{part_path}.{start}-{end}"
+            with open(segment_path, "rb") as segment_file:
+                part_file.write(segment_file.read())
+            os.remove(segment_path)
+
+    return transferred
+
+
+def download_media(file_id, part_path, total_size=None, cancel=None):
+    """Download a Drive file's content into `part_path` with resumable HTTP range requests.
+
+    Bytes already in `part_path` (or its segment files) from an interrupted earlier run are kept.
+    Large files are fetched as DRIVE_DOWNLOAD_WORKERS parallel ranges. Setting the `cancel` event stops
+    the download with DownloadCancelled before its next chunk. Returns the number of bytes transferred.
+    """
+    session = get_drive_session()
+    uri = session.service.files().get_media(fileId=file_id).uri
+    workers = CONFIG["DRIVE_DOWNLOAD_WORKERS"]
+
+    if total_size and workers > 1 and total_size >= PARALLEL_MIN_BYTES and not os.path.exists(part_path):
+        return _download_parallel(uri, part_path, total_size, workers, cancel)
+    return _download_range(session.http, uri, part_path, cancel=cancel)
@@ -0,0 +1,133 @@
+import os
+import time
+import logging
+from googleapiclient.errors import HttpError
+from config import CONFIG
+from state_store import load_json_state, save_json_state
+
+MANIFEST_FILE = os.path.join(CONFIG["CACHE_DIR"], "drive_manifest.json")
+
+# Fields kept for every Drive image in the manifest
+FILE_FIELDS = "id, name, mimeType, md5Checksum, size, modifiedTime, parents, trashed"
+
+# Drive caps pageSize at 1000 for both files.list and changes.list
+PAGE_SIZE = 1000
+
+# Force a full re-list now and then so a missed change can never stick around forever
+MAX_MANIFEST_AGE = 7 * 24 * 60 * 60  # 7 days
+
+
+def _manifest_entry(drive_file):
+    """Reduce a Drive file resource to what the frame needs to remember."""
+    return {
+        "name": drive_file["name"],
+        "mimeType": drive_file.get("mimeType"),
+        "md5Checksum": drive_file.get("md5Checksum"),
+        "size": int(drive_file.get("size", 0)),
+        "modifiedTime": drive_file.get("modifiedTime"),
+    }
+
+
+def _is_folder_image(drive_file, folder_id):
+    """Check whether a Drive file resource is a live image inside the watched folder."""
+    return (
+        not drive_file.get("trashed", False)
+        and folder_id in drive_file.get("parents", [])
+        and drive_file.get("mimeType", "").startswith("image/")
+    )
+
+
+def full_sync(drive_service, folder_id):
+    """List every image in the folder (following nextPageToken) and start a fresh manifest."""
+    # Grab the start token first so changes made while we page through the folder are replayed next wake
+    start_page_token = drive_service.changes().getStartPageToken().execute()["startPageToken"]
+
+    files = {}
+    page_token = None
+    pages = 0
+    while True:
+        results = drive_service.files().list(
+            q=f"'{folder_id}' in parents and (mimeType contains 'image/') and trashed = false",
+            fields=f"nextPageToken, files({FILE_FIELDS})",
+            pageSize=PAGE_SIZE,
+            pageToken=page_token,
+        ).execute()
+        pages += 1
+
+        for drive_file in results.get("files", []):
+            files[drive_file["id"]] = _manifest_entry(drive_file)
+
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            break
+
+    logging.info(f"📋 Full Drive sync: {len(files)} images in {pages} page(s)")
+    return {
+        "folder_id": folder_id,
+        "start_page_token": start_page_token,
+        "files": files,
+        "full_sync_at": time.time(),
+    }
+
+
+def apply_changes(drive_service, manifest):
+    """Replay the Drive changes feed since the saved start page token into the manifest."""
+    folder_id = manifest["folder_id"]
+    files = manifest["files"]
+    page_token = manifest["start_page_token"]
+    added, removed = 0, 0
+
+    while page_token:
+        results = drive_service.changes().list(
+            pageToken=page_token,
+            fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}))",
+            pageSize=PAGE_SIZE,
+            includeRemoved=True,
+            spaces="drive",
+        ).execute()
+
+        for change in results.get("changes", []):
+            file_id = change["fileId"]
+            drive_file = change.get("file")
+            if not change.get("removed") and drive_file and _is_folder_image(drive_file, folder_id):
+                files[file_id] = _manifest_entry(drive_file)
+                added += 1
+            elif files.pop(file_id, None) is not None:
+                removed += 1
+
+        if "newStartPageToken" in results:
+            manifest["start_page_token"] = results["newStartPageToken"]
+        page_token = results.get("nextPageToken")
+
+    logging.info(f"📋 Drive changes applied: {added} added/updated, {removed} removed, {len(files)} images")
+    return manifest
+
+
+def sync_manifest(drive_service, folder_id):
+    """Bring the persistent Drive manifest up to date and return it.
+
+    The first sync (or a folder change, or a stale manifest) lists the whole folder;
+    every other wake costs a single small `changes.list` request.
+    """
+    manifest = load_json_state(MANIFEST_FILE)
+
+    needs_full_sync = (
+        not manifest
+        or manifest.get("folder_id") != folder_id
+        or not manifest.get("start_page_token")
+        or time.time() - manifest.get("full_sync_at", 0) > MAX_MANIFEST_AGE
+    )
+
+    if needs_full_sync:
+        manifest = full_sync(drive_service, folder_id)
+    else:
+        try:
+            manifest = apply_changes(drive_service, manifest)
+        except HttpError as e:
+            # An expired or invalid page token means the delta is lost; start over
+            logging.warning(f"⚠ Drive changes feed rejected the saved token ({e}). Running a full sync.")
+            manifest = full_sync(drive_service, folder_id)
+
+    save_json_state(MANIFEST_FILE, manifest)
+    return manifest
+
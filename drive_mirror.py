@@ -0,0 +1,108 @@
+import os
+import re
+import time
+import logging
+from config import CONFIG
+from state_store import load_json_state, save_json_state
+from drive_download import check_cancelled
+
+INDEX_FILE = os.path.join(CONFIG["MIRROR_DIR"], "index.json")
+
+# Interrupted downloads are resumed on a later wake, but not kept forever
+PARTIAL_MAX_AGE = 3 * 24 * 60 * 60  # 3 days
+
+
+def _load_index():
+    return load_json_state(INDEX_FILE, {})
+
+
+def _entry_path(entry):
+    return os.path.join(CONFIG["MIRROR_DIR"], entry["file"])
+
+
+def mirror_filename(file_id, version, name):
+    """Build the on-disk name for a mirrored Drive file, keyed by id and content version."""
+    extension = os.path.splitext(name)[1].lower()
+    return f"{file_id}_{re.sub(r'[^A-Za-z0-9]', '', version)}{extension}"
+
+
+def lookup(file_id, version):
+    """Return the local path of a mirrored file if this exact version is present, marking it recently used."""
+    index = _load_index()
+    entry = index.get(file_id)
+    if not entry or entry["version"] != version or not os.path.exists(_entry_path(entry)):
+        return None
+
+    entry["last_used"] = time.time()
+    save_json_state(INDEX_FILE, index)
+    return _entry_path(entry)
+
+
+def store(file_id, version, name, write_to, cancel=None):
+    """Download a file into the mirror and evict least-recently-used files over the byte budget.
+
+    `write_to` is called with the path of a `.part` file and must leave the complete contents there.
+    A `.part` file left behind by a failed download is kept so the next attempt can resume it.
+    If the `cancel` event is set by the time it finishes, the index is left alone (DownloadCancelled).
+    """
+    os.makedirs(CONFIG["MIRROR_DIR"], exist_ok=True)
+    filename = mirror_filename(file_id, version, name)
+    path = os.path.join(CONFIG["MIRROR_DIR"], filename)
+    tmp_path = f"{path}.part"
+
+    write_to(tmp_path)
+    check_cancelled(cancel)  # A cancelled fetch must not race the next one on the index
+    os.replace(tmp_path, path)
+    _remove_stale_partials()
+
+    index = _load_index()
+    previous = index.get(file_id)
+    if previous and previous["file"] != filename and os.path.exists(_entry_path(previous)):
+        os.remove(_entry_path(previous))  # Stale version of the same file
+
+    index[file_id] = {
+        "file": filename,
+        "name": name,
+        "version": version,
+        "size": os.path.getsize(path),
+        "last_used": time.time(),
+    }
+    _evict(index, keep=file_id)
+    save_json_state(INDEX_FILE, index)
+    return path
+
+
+def _remove_stale_partials():
+    """Delete partial downloads nobody has resumed for a while."""
+    cutoff = time.time() - PARTIAL_MAX_AGE
+    for filename in os.listdir(CONFIG["MIRROR_DIR"]):
+        path = os.path.join(CONFIG["MIRROR_DIR"], filename)
+        if ".part" in filename and os.path.getmtime(path) < cutoff:
+            os.remove(path)
+
+
+def _evict(index, keep):
+    """Drop least-recently-used files until the mirror fits in MIRROR_MAX_BYTES."""
+    total = sum(entry["size"] for entry in index.values())
+    if total <= CONFIG["MIRROR_MAX_BYTES"]:
+        return
+
+    for key, entry in sorted(index.items(), key=lambda item: item[1]["last_used"]):
+        if total <= CONFIG["MIRROR_MAX_BYTES"]:
+            break
+        if key == keep:
+            continue
+        if os.path.exists(_entry_path(entry)):
+            os.remove(_entry_path(entry))
+        total -= entry["size"]
+        del index[key]
+        logging.info(f"🧹 Evicted {entry['name']} from the Drive mirror")
+
+
+def cached_images():
+    """List the mirrored images as (path, name) pairs, for use when Drive is unreachable."""
+    return [
+        (_entry_path(entry), entry["name"])
+        for entry in _load_index().values()
+        if os.path.exists(_entry_path(entry))
+    ]
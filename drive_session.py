@@ -0,0 +1,79 @@
+import time
+import logging
+import threading
+import timing
+import httplib2
+import google_auth_httplib2
+import googleapiclient.discovery
+from google.oauth2 import service_account
+from google.auth.credentials import AnonymousCredentials
+from config import CONFIG
+
+# Socket timeout for every Drive request made through the shared connection
+HTTP_TIMEOUT = 30
+
+_session = None
+# The source race, the log upload and parallel downloads may all ask for the session at once
+_session_lock = threading.Lock()
+
+
+class DriveSession:
+    """One authenticated Drive client per process.
+
+    Credentials are loaded once, the access token is cached until it expires,
+    and every request goes through the same keep-alive HTTP connection.
+    """
+
+    @timing.timed("drive_auth")
+    def __init__(self):
+        started = time.monotonic()
+
+        if CONFIG["DRIVE_API_ENDPOINT"] and not CONFIG["SERVICE_ACCOUNT_FILE"]:
+            self.credentials = AnonymousCredentials()  # Local stand-ins don't check tokens
+        else:
+            self.credentials = service_account.Credentials.from_service_account_file(
+                CONFIG["SERVICE_ACCOUNT_FILE"],
+                scopes=["https://www.googleapis.com/auth/drive"],
+            )
+
+        # httplib2 keeps the TLS connection to the API host open between requests
+        self.http = self.new_http()
+
+        client_options = None
+        if CONFIG["DRIVE_API_ENDPOINT"]:
+            client_options = {"api_endpoint": CONFIG["DRIVE_API_ENDPOINT"]}
+
+        self.service = googleapiclient.discovery.build(
+            "drive", "v3", http=self.http, cache_discovery=False, client_options=client_options
+        )
+
+        self.setup_seconds = time.monotonic() - started
+        self.reuse_count = 0
+        logging.info(f"🔑 Drive session ready in {self.setup_seconds:.2f}s")
+
+    def new_http(self):
+        """Create another authorized connection sharing these credentials (httplib2 objects aren't thread-safe)."""
+        return google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+
+    def request(self, uri, method="GET", headers=None):
+        """Make an authorized raw request over the shared connection (for media URLs outside the API client)."""
+        return self.http.request(uri, method=method, headers=headers or {})
+
+
+def get_drive_session():
+    """Return the process-wide Drive session, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = DriveSession()
+        else:
+            _session.reuse_count += 1
+            logging.info(
+                f"♻ Reusing Drive session (#{_session.reuse_count}, saved ~{_session.setup_seconds:.2f}s of setup)"
+            )
+        return _session
+
+
+def has_drive_session():
+    """Check whether this process already holds a Drive session."""
+    return _session is not None
@@ -0,0 +1,147 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+import timing
+from pisugar import PiSugarClient
+
+# ✅ How often battery current and voltage are read while the frame is busy
+SAMPLE_INTERVAL = float(os.getenv("ENERGY_SAMPLE_MS", 250)) / 1000  # 0 disables sampling
+
+
+def _parse_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class EnergySampler:
+    """Poll PiSugar battery current and voltage on a background thread.
+
+    Each sample is tagged with the span running at that moment (see timing.current_phase),
+    so the energy between samples can be charged to the phase that spent it.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = []  # (monotonic time, phase, watts)
+        self.stopped = threading.Event()
+        self.thread = None
+        self.client = PiSugarClient()
+
+    def start(self):
+        """Start sampling. Returns False (and samples nothing) if disabled or pisugar-server isn't reachable."""
+        if self.interval <= 0:
+            return False
+        try:
+            self.client.connect()
+        except OSError as e:
+            logging.warning(f"⚠ Energy sampling disabled, PiSugar unavailable: {e}")
+            return False
+
+        self.started_at = time.time()
+        self.thread = threading.Thread(target=self._run, name="energy-sampler", daemon=True)
+        self.thread.start()
+        return True
+
+    def _run(self):
+        while True:
+            self._sample()
+            if self.stopped.wait(self.interval):
+                break
+
+    def _sample(self):
+        phase = timing.current_phase()
+        try:
+            values = self.client.get_many(["battery_i", "battery_v"])
+        except OSError as e:
+            logging.warning(f"⚠ Energy sample failed: {e}")
+            return
+
+        current, voltage = _parse_float(values["battery_i"]), _parse_float(values["battery_v"])
+        if current is not None and voltage is not None:
+            # The sign of battery_i depends on charge direction; only the magnitude of the draw matters here
+            self.samples.append((time.monotonic(), phase, abs(current * voltage)))
+
+    def report(self):
+        """The energy report for the samples so far, without stopping."""
+        if self.thread is None:
+            return None
+        return energy_report(list(self.samples))
+
+    def stop(self):
+        """Stop sampling and return the energy report (see `energy_report`)."""
+        if self.thread is None:
+            return None
+        self.stopped.set()
+        self.thread.join()
+        self.client.close()
+        return energy_report(self.samples)
+
+
+def energy_report(samples):
+    """Integrate (time, phase, watts) samples into mWh per phase.
+
+    Each interval is charged, by the trapezoid rule, to the phase of the sample that starts it.
+    """
+    phases = {}
+    for (t0, phase, w0), (t1, _, w1) in zip(samples, samples[1:]):
+        joules = (w0 + w1) / 2 * (t1 - t0)
+        phases[phase] = phases.get(phase, 0.0) + joules / 3.6  # 1 mWh = 3.6 J
+
+    seconds = samples[-1][0] - samples[0][0] if len(samples) > 1 else 0.0
+    total = sum(phases.values())
+    return {
+        "total_mwh": round(total, 3),
+        "phases": {phase: round(mwh, 3) for phase, mwh in sorted(phases.items(), key=lambda item: -item[1])},
+        "samples": len(samples),
+        "average_w": round(total * 3.6 / seconds, 3) if seconds else None,
+    }
+
+
+def record_report(label, started, report):
+    """Record a report (see `energy_report`) with this wake's spans and log it. Needs at least two samples."""
+    if report and report["samples"] > 1:
+        timing.record("energy_sampling", started, time.time() - started, label=label, **report)
+        breakdown = ", ".join(f"{phase} {mwh:.2f}" for phase, mwh in list(report["phases"].items())[:4])
+        logging.info(f"🔋 {label.title()} used {report['total_mwh']:.2f} mWh ({breakdown})")
+
+
+@contextmanager
+def measure(label):
+    """Sample energy for the enclosed block and record the per-phase report with this wake's spans."""
+    sampler = EnergySampler()
+    started = time.time()
+    sampler.start()
+    try:
+        yield
+    finally:
+        record_report(label, started, sampler.stop())
+
+
+def energy_sensors(wake_id=timing.WAKE_ID):
+    """MQTT sensor values: mWh per refresh and per phase for this wake, and the whole of the previous wake.
+
+    A wake's "wake" report is only complete once it powers off, after its telemetry, so it is published by the next one.
+    """
+    sensors = {}
+    last_wake = None
+    for entry in timing.load_spans():
+        if entry.get("name") != "energy_sampling":
+            continue
+        label = entry.get("label", "refresh")
+        if entry.get("wake") != wake_id:
+            if label == "wake":
+                last_wake = entry
+            continue
+        key = f"energy_{label}_mwh"
+        sensors[key] = round(sensors.get(key, 0.0) + entry["total_mwh"], 2)
+        if label == "wake":
+            continue  # Its phases overlap the refresh report's
+        for phase, mwh in entry["phases"].items():
+            sensors[f"energy_{phase}_mwh"] = round(sensors.get(f"energy_{phase}_mwh", 0.0) + mwh, 2)
+    if last_wake:
+        sensors["energy_last_wake_mwh"] = round(last_wake["total_mwh"], 2)
+    return sensors
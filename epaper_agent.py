@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import signal
+import asyncio
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import paho.mqtt.client as mqtt
+import mqtt_update
+from mqtt_update import (
+    MQTT_BROKER, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD, MQTT_TOPIC_PREFIX,
+    PUBLISH_TIMEOUT, SENSOR_LABELS, MQTTPublisher,
+)
+from mqtt_command_listener import COMMAND_QUEUE_SIZE, CommandHandler, coalesce_key, run_command
+from display_service import render_request
+from pisugar import PiSugarClient
+
+# ✅ How often the agent reports PiSugar telemetry, and (optionally) refreshes the panel on its own
+POLL_INTERVAL = float(os.getenv("AGENT_POLL_MINUTES", 5)) * 60
+REFRESH_INTERVAL = float(os.getenv("AGENT_REFRESH_MINUTES", 0)) * 60  # 0 = only refresh on MQTT commands
+
+
+class AgentCommands(CommandHandler):
+    """The listener's commands, carried out over the agent's shared connections.
+
+    Runs on the agent's command thread; renders and scripts go to the panel's worker, PiSugar commands to the PiSugar worker.
+    """
+
+    def __init__(self, agent):
+        self.agent = agent
+
+    def respond(self, topic, message):
+        self.agent.respond(topic, message)
+
+    def render(self, image_path=None):
+        return asyncio.run_coroutine_threadsafe(self.agent.render(image_path), self.agent.loop).result()
+
+    def run_script(self, command):
+        # The script drives the panel itself, so run it on the panel's worker
+        return self.agent.render_executor.submit(run_command, command).result()
+
+    def pisugar_command(self, command):
+        return self.agent.pisugar_executor.submit(self.agent.pisugar.command, command).result()
+
+
+class EpaperAgent:
+    """Listener, telemetry and display in one asyncio process.
+
+    One MQTT connection, one PiSugar connection and one warm display driver are shared by
+    every task; blocking work (panel refreshes, PiSugar I/O, acknowledgement waits) runs on executors.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.commands = None
+        self.queued_refresh = None  # The refresh job still waiting in `commands`, if any
+        self.connected = None
+
+        # The panel and the PiSugar socket each get a single worker, so their calls never overlap
+        self.render_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render")
+        self.pisugar_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pisugar")
+        # Commands block on the workers above, so they run on a thread of their own rather than the event loop
+        self.command_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="command")
+        self.pisugar = PiSugarClient()
+        self.command_handler = AgentCommands(self)
+
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        if MQTT_USERNAME and MQTT_PASSWORD:
+            self.client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_message = self.on_message
+
+    # --- MQTT (callbacks run on paho's network thread and hand off to the event loop) ---
+
+    def on_connect(self, client, userdata, flags, reason_code, properties):
+        # Subscribing here means commands keep arriving after paho reconnects
+        client.subscribe(f"{MQTT_TOPIC_PREFIX}/command")
+        logging.info(f"📡 Agent connected. Listening on {MQTT_TOPIC_PREFIX}/command...")
+        self.loop.call_soon_threadsafe(self.connected.set)
+
+    def on_disconnect(self, client, userdata, flags, reason_code, properties):
+        # Telemetry pauses until paho has reconnected
+        if reason_code.is_failure:
+            logging.warning(f"⚠️ Agent lost the MQTT connection ({reason_code}). Reconnecting...")
+        self.loop.call_soon_threadsafe(self.connected.clear)
+
+    def on_message(self, client, userdata, msg):
+        payload = msg.payload.decode("utf-8").strip()
+        logging.info(f"📥 Received MQTT command: {msg.topic} → {payload}")
+        self.loop.call_soon_threadsafe(self.enqueue, payload)
+
+    def respond(self, topic, message):
+        """Publish a command response over the shared connection."""
+        self.client.publish(f"{MQTT_TOPIC_PREFIX}/response/{topic}", message, qos=1, retain=False)
+        logging.info(f"📡 Sent MQTT response: {topic} → {message}")
+
+    def enqueue(self, payload):
+        """Queue a command; a refresh replaces one that hasn't started yet."""
+        key = coalesce_key(payload)
+        if key and self.queued_refresh:
+            logging.info(f"🔁 Replacing queued '{self.queued_refresh['payload']}' with '{payload}'")
+            self.queued_refresh["payload"] = payload
+            self.queued_refresh["coalesced"] += 1
+            return
+
+        if self.commands.full():
+            logging.warning(f"⚠️ Command queue full. Dropping: {payload}")
+            self.respond("busy", f"Error: queue full, dropped {payload}")
+            return
+
+        job = {"payload": payload, "coalesced": 0, "received_at": time.monotonic()}
+        self.commands.put_nowait(job)
+        if key:
+            self.queued_refresh = job
+
+    # --- Blocking work, run on the executors ---
+
+    def _publish_status(self, status):
+        with MQTTPublisher(client=self.client) as publisher:
+            for key, value in status.items():
+                publisher.publish_sensor(key, value)
+
+    # --- Tasks ---
+
+    async def render(self, image_path=None):
+        """Render on the panel's worker thread, keeping the event loop (and MQTT) responsive."""
+        try:
+            result = await self.loop.run_in_executor(self.render_executor, render_request, image_path)
+        except Exception as e:
+            result = {"ok": False, "error": str(e)}
+
+        if result["ok"]:
+            logging.info(f"✅ Showed {result['image']} in {result['seconds']}s")
+        else:
+            logging.error(f"❌ Render failed: {result['error']}")
+        return result["ok"]
+
+    async def publish_telemetry(self):
+        """Read every PiSugar metric over the shared socket and publish it over the shared MQTT connection."""
+        try:
+            status = await self.loop.run_in_executor(
+                self.pisugar_executor, self.pisugar.get_many, list(SENSOR_LABELS)
+            )
+            await self.loop.run_in_executor(None, self._publish_status, status)
+            return True
+        except Exception as e:
+            logging.error(f"❌ Telemetry update failed: {e}")
+            return False
+
+    async def handle(self, payload):
+        """Run one MQTT command (see mqtt_command_listener.CommandHandler). Returns True on success."""
+        return await self.loop.run_in_executor(self.command_executor, self.command_handler.handle, payload)
+
+    async def command_task(self):
+        """Run queued MQTT commands one at a time."""
+        while True:
+            job = await self.commands.get()
+            if job is self.queued_refresh:
+                self.queued_refresh = None
+
+            try:
+                ok = await self.handle(job["payload"])
+            except Exception as e:
+                logging.error(f"❌ Command '{job['payload']}' crashed: {e}")
+                ok = False
+
+            self.respond("result", json.dumps({
+                "command": job["payload"],
+                "ok": bool(ok),
+                "coalesced": job["coalesced"],
+                "seconds": round(time.monotonic() - job["received_at"], 2),
+            }))
+
+    async def pisugar_task(self):
+        """Publish PiSugar telemetry every POLL_INTERVAL while the broker is reachable."""
+        while True:
+            await self.connected.wait()
+            await self.publish_telemetry()
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def scheduler_task(self):
+        """Queue a panel refresh every REFRESH_INTERVAL, coalescing with any refresh requested over MQTT."""
+        while True:
+            await asyncio.sleep(REFRESH_INTERVAL)
+            logging.info("⏰ Scheduled refresh")
+            self.enqueue("display")
+
+    # --- Lifecycle ---
+
+    async def run(self, once=False, image_path=None):
+        """Serve until cancelled, or with `once`, do one wake cycle (render + telemetry concurrently) and return."""
+        self.loop = asyncio.get_running_loop()
+        self.commands = asyncio.Queue(COMMAND_QUEUE_SIZE)
+        self.connected = asyncio.Event()
+
+        # paho runs the socket on its own thread and reconnects by itself
+        mqtt_update.set_shared_client(self.client)
+        self.client.connect_async(MQTT_BROKER, MQTT_PORT, 60)
+        self.client.loop_start()
+
+        try:
+            if once:
+                try:
+                    await asyncio.wait_for(self.connected.wait(), PUBLISH_TIMEOUT)
+                except asyncio.TimeoutError:
+                    logging.error(f"❌ No MQTT connection to {MQTT_BROKER}:{MQTT_PORT}. Rendering without it.")
+                    mqtt_update.set_shared_client(None)
+                rendered, _ = await asyncio.gather(self.render(image_path), self.publish_telemetry())
+                return rendered
+
+            tasks = [self.command_task(), self.pisugar_task()]
+            if REFRESH_INTERVAL > 0:
+                tasks.append(self.scheduler_task())
+            await asyncio.gather(*tasks)
+        finally:
+            mqtt_update.set_shared_client(None)
+            self.client.disconnect()
+            self.client.loop_stop()
+            self.pisugar.close()
+            self.command_executor.shutdown(wait=False)
+            self.render_executor.shutdown(wait=True)
+            self.pisugar_executor.shutdown(wait=False)
+
+
+async def main(once=False, image_path=None):
+    main_task = asyncio.current_task()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, main_task.cancel)
+    try:
+        return await EpaperAgent().run(once, image_path)
+    except asyncio.CancelledError:
+        logging.info("🛑 Agent stopped.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ePaper Frame agent: MQTT commands, telemetry and display in one process")
+    parser.add_argument("--once", action="store_true",
+                        help="Render one image and publish telemetry, then exit (for wake-and-shutdown setups)")
+    parser.add_argument("--image", default=None, help="With --once, display this image file")
+    args, _ = parser.parse_known_args()  # Display flags (--source, --simulator, ...) are read by config.py
+
+    try:
+        asyncio.run(main(args.once, args.image))
+    except KeyboardInterrupt:
+        logging.info("🛑 Agent stopped by user.")
@@ -1,41 +1,72 @@
 import json
-from PIL import Image, ImageTk, ImageDraw
-import tkinter as tk
-from flask import Flask, render_template_string, send_file
+from PIL import Image, ImageDraw, ImageChops
 import io
+import base64
+import queue
 import threading
-import webbrowser
-import time
 import os
 import traceback
+from .refresh_timing import EmulatedClock, load_refresh_timing
+from .frame_sinks import MemorySink
 
 currentdir = os.path.dirname(os.path.realpath(__file__))
 
+# Deltas larger than this share of the screen are sent as "fetch the full frame" instead
+DELTA_MAX_FRACTION = 0.5
+
 class EPD:
-    def __init__(self, config_file="epd2in13", use_tkinter=False, use_color=False, update_interval=2, reverse_orientation=False): 
-        """Initialize the EPD Emulator with Tkinter or Flask based on configuration."""
-        config_path = os.path.join(currentdir, 'config', f'{config_file}.json')
-        self.load_config(config_path)
+    def __init__(self, config_file="epd2in13", use_tkinter=False, use_color=False, update_interval=2, reverse_orientation=False, size=None, clock_speed=0,
+                 headless=False, frame_sink=None, port=5000): 
+        """Initialize the EPD Emulator with Tkinter, Flask or (headless) just a frame sink, based on configuration."""
+        if size:
+            # An explicit (width, height), e.g. for a driver running on the SPI backend
+            self.width, self.height = size
+        else:
+            config_path = os.path.join(currentdir, 'config', f'{config_file}.json')
+            self.load_config(config_path)
 
         self.use_color = use_color  
         self.image_mode = 'RGB' if self.use_color else '1'  
         self.use_tkinter = use_tkinter
         self.update_interval = update_interval  # Keep in seconds
+        self.headless = headless
+        self.port = port
+
+        # Every displayed frame also goes to the sink (headless mode keeps them in memory by default)
+        self.frame_sink = frame_sink if frame_sink is not None else (MemorySink() if headless else None)
+
+        # display() and Clear() take as long as a full refresh of this panel, on the emulated clock
+        self.refresh_timing = load_refresh_timing(config_file)
+        self.clock = EmulatedClock(clock_speed)
 
         print(f"✅ EPD Emulator initialized with update interval: {self.update_interval}s")
-        print(f"🔍 Tkinter Mode: {'Enabled' if self.use_tkinter else 'Disabled'}")
+        if not self.headless:
+            print(f"🔍 Tkinter Mode: {'Enabled' if self.use_tkinter else 'Disabled'}")
 
         # Initialize the correct UI mode
         self.image = Image.new(self.image_mode, (self.width, self.height), "white")
         self.draw = ImageDraw.Draw(self.image)
 
-        if self.use_tkinter:
+        # The current frame, PNG-encoded in memory; a change only marks it dirty, and it is encoded when next served
+        self.frame_lock = threading.Lock()
+        self.png_bytes = None
+        self.frame_dirty = True
+        self.frame_version = 0
+        self.etag_prefix = os.urandom(4).hex()  # ETags from an earlier run never match this one's
+        self.etag = None
+        self.last_frame = None  # Copy of the frame behind `etag`, to diff the next one against
+        self.clients = []  # One event queue per browser connected to /events
+        self.clients_lock = threading.Lock()
+        self.mark_frame_changed()
+
+        if self.headless:
+            print(f"🫥 Headless Mode Enabled ({type(self.frame_sink).__name__})")
+        elif self.use_tkinter:
             print("🖥 Tkinter Mode Enabled")
             self.init_tkinter()
         else:
             print("🌐 Flask Mode Enabled")
             self.init_flask()
-            self.start_image_update_loop()
 
     def load_config(self, config_file):
         """Load the display configuration from a JSON file."""
@@ -52,6 +83,9 @@ class EPD:
 
     def init_tkinter(self):
         """Initialize the Tkinter GUI window."""
+        import tkinter as tk
+        from PIL import ImageTk
+        self.tk, self.ImageTk = tk, ImageTk
         print("🖥 Initializing Tkinter UI...")
         self.root = tk.Tk()
         self.root.title(f"Waveshare {self.width}x{self.height} EPD Emulator")
@@ -73,12 +107,13 @@ class EPD:
     def update_tkinter(self):
         """Update the Tkinter window."""
         print("🔄 Updating Tkinter UI...")
-        self.tk_image = ImageTk.PhotoImage(self.image)
+        self.tk_image = self.ImageTk.PhotoImage(self.image)
         self.canvas.itemconfig(self.image_on_canvas, image=self.tk_image)
         self.root.update()
 
     def init_flask(self):
         """Initialize Flask web server."""
+        from flask import Flask, render_template_string, request, Response
         print("🌐 Starting Flask Server...")
         self.app = Flask(__name__)
 
@@ -98,79 +133,172 @@ class EPD:
                             font-family: Arial, sans-serif;
                             text-align: center;
                         }}
-                        img {{
+                        canvas {{
                             width: auto;
                             height: {self.height}px;
                             border: 2px solid black;
                         }}
                     </style>
                     <script>
-                        function updateImage() {{
-                            var image = document.getElementById("screenImage");
-                            image.src = "screen.png?t=" + new Date().getTime(); // Prevent caching
+                        var etag = null;
+                        var pending = Promise.resolve();
+
+                        async function loadFrame() {{
+                            var response = await fetch("screen.png", {{cache: "no-cache"}});
+                            var bitmap = await createImageBitmap(await response.blob());
+                            document.getElementById("screen").getContext("2d").drawImage(bitmap, 0, 0);
+                            etag = response.headers.get("ETag").replace(/"/g, "");
+                        }}
+
+                        async function applyFrame(frame) {{
+                            if (frame.etag === etag) return;
+                            if (frame.delta && frame.base === etag) {{
+                                // Only the dirty rectangle changed: draw it over the frame we already have
+                                var patch = new Image();
+                                patch.src = "data:image/png;base64," + frame.delta;
+                                await patch.decode();
+                                document.getElementById("screen").getContext("2d").drawImage(patch, frame.bbox[0], frame.bbox[1]);
+                                etag = frame.etag;
+                            }} else {{
+                                await loadFrame();
+                            }}
                         }}
-                        setInterval(updateImage, {int(self.update_interval * 1000)});
+
+                        // The server pushes an event whenever the emulated panel changes
+                        var events = new EventSource("events?delta=1");
+                        events.addEventListener("frame", function(message) {{
+                            var frame = JSON.parse(message.data);
+                            pending = pending.then(function() {{ return applyFrame(frame); }}).catch(console.error);
+                        }});
                     </script>
                 </head>
                 <body>
                     <h2>EPD Emulator</h2>
-                    <img id="screenImage" src="screen.png" alt="EPD Emulator">
+                    <canvas id="screen" width="{self.width}" height="{self.height}"></canvas>
                 </body>
                 </html>
             ''')
 
         @self.app.route('/screen.png')
         def display_image():
-            """Serve the latest image file."""
+            """Serve the current frame from memory, or 304 if the browser already has it."""
             try:
-                screen_path = os.path.join(os.path.dirname(__file__), 'screen.png')
-                if not os.path.exists(screen_path):
-                    print("⚠ screen.png not found. Generating new image.")
-                    self.update_image_bytes()
-
-                print("📡 Serving Updated Image...")
-                response = send_file(screen_path, mimetype='image/png')
-                response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
-                response.headers["Pragma"] = "no-cache"
-                response.headers["Expires"] = "0"
+                with self.frame_lock:
+                    etag = self.etag
+
+                if etag in request.if_none_match:
+                    return Response(status=304, headers={"ETag": f'"{etag}"', "Cache-Control": "no-cache"})
+
+                png_bytes, etag = self.frame_png()
+
+                response = Response(png_bytes, mimetype='image/png')
+                response.headers["ETag"] = f'"{etag}"'
+                response.headers["Cache-Control"] = "no-cache"  # Cache, but revalidate every time
                 return response
             except Exception as e:
                 traceback.print_exc()
                 return "Internal Server Error", 500
 
+        @self.app.route('/events')
+        def events():
+            """Server-Sent Events: one "frame" event per change (with ?delta=1, just the dirty rectangle)."""
+            client = {"queue": queue.Queue(maxsize=8), "delta": request.args.get("delta") == "1"}
+            with self.frame_lock:
+                client["queue"].put({"etag": self.etag})
+            with self.clients_lock:
+                self.clients.append(client)
+
+            def stream():
+                try:
+                    yield f"retry: {int(self.update_interval * 1000)}\n\n"
+                    while True:
+                        try:
+                            event = client["queue"].get(timeout=15)
+                        except queue.Empty:
+                            yield ": keepalive\n\n"
+                            continue
+                        yield f"event: frame\ndata: {json.dumps(event)}\n\n"
+                finally:
+                    with self.clients_lock:
+                        self.clients.remove(client)
+
+            return Response(stream(), mimetype='text/event-stream',
+                            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
         threading.Thread(target=self.run_flask).start()
 
     def run_flask(self):
         """Start Flask server."""
-        print("🚀 Running Flask Server on http://127.0.0.1:5000/")
-        webbrowser.open("http://127.0.0.1:5000/")
-        self.app.run(port=5000, debug=False, use_reloader=False)
+        import webbrowser
+        print(f"🚀 Running Flask Server on http://127.0.0.1:{self.port}/")
+        webbrowser.open(f"http://127.0.0.1:{self.port}/")
+        self.app.run(port=self.port, debug=False, use_reloader=False)
 
-    def update_image_bytes(self):
-        """Save the current image to disk, ensuring no conflicts."""
-        try:
-            screen_path = os.path.join(os.path.dirname(__file__), 'screen.png')
+    def mark_frame_changed(self):
+        """If the pixels changed, give the frame a new ETag, mark it dirty and notify connected browsers."""
+        if self.headless:
+            return  # Nobody to serve it to
+        frame = self.image.copy()
+        with self.frame_lock:
+            previous_etag, previous_frame = self.etag, self.last_frame
+            bbox = None
+            if previous_frame is not None:
+                bbox = ImageChops.difference(previous_frame.convert('RGB'), frame.convert('RGB')).getbbox()
+                if bbox is None:
+                    return  # Same pixels (e.g. display() right after paste_image)
+            self.frame_version += 1
+            self.etag = f"{self.etag_prefix}-{self.frame_version}"
+            self.last_frame = frame
+            self.frame_dirty = True
+            etag = self.etag
+        self.notify_clients(etag, frame, previous_etag, bbox)
 
-            # Delete `screen.png` before saving new image
-            if os.path.exists(screen_path):
-                print("🗑 Removing previous screen.png to avoid conflicts.")
-                os.remove(screen_path)
+    def frame_png(self):
+        """Return (PNG bytes, ETag) of the current frame, encoding it only if it changed since it was last served."""
+        with self.frame_lock:
+            if self.frame_dirty:
+                buffer = io.BytesIO()
+                self.last_frame.save(buffer, format='PNG')
+                self.png_bytes, self.frame_dirty = buffer.getvalue(), False
+            return self.png_bytes, self.etag
 
-            # Save the new image
-            self.image.save(screen_path, format='PNG')
-            print("✅ EPD Emulator updated screen.png")
-        except Exception as e:
-            print(f"❌ Error updating screen.png: {e}")
+    def frame_delta(self, bbox, frame):
+        """Return (bbox, base64 PNG of that region) for the changed part of `frame`, or None if it's too large."""
+        left, top, right, bottom = bbox
+        if (right - left) * (bottom - top) > DELTA_MAX_FRACTION * self.width * self.height:
+            return None
 
-    def start_image_update_loop(self):
-        """Continuously update the image for Flask display."""
-        print("🔄 Starting Image Update Loop...")
-        def update_loop():
-            while True:
-                self.update_image_bytes()
-                time.sleep(self.update_interval)
+        buffer = io.BytesIO()
+        frame.crop(bbox).save(buffer, format='PNG')
+        return list(bbox), base64.b64encode(buffer.getvalue()).decode('ascii')
 
-        threading.Thread(target=update_loop, daemon=True).start()
+    def notify_clients(self, etag, frame, previous_etag, bbox):
+        """Queue a "frame" event for every browser on /events (`bbox` is the changed region, None for the first frame)."""
+        with self.clients_lock:
+            clients = list(self.clients)
+        if not clients:
+            return
+
+        full_event = {"etag": etag}
+        delta_event = full_event
+        if bbox is not None and any(client["delta"] for client in clients):
+            delta = self.frame_delta(bbox, frame)
+            if delta:
+                bbox, patch = delta
+                delta_event = {"etag": etag, "base": previous_etag, "bbox": bbox, "delta": patch}
+
+        for client in clients:
+            event = delta_event if client["delta"] else full_event
+            try:
+                client["queue"].put_nowait(event)
+            except queue.Full:
+                # A slow browser has missed frames: drop its backlog and have it fetch the full frame
+                try:
+                    while True:
+                        client["queue"].get_nowait()
+                except queue.Empty:
+                    pass
+                client["queue"].put_nowait(full_event)
 
     def init(self):
         """Initialize the ePaper display."""
@@ -181,19 +309,37 @@ class EPD:
         print("🧹 Clearing Screen...")
         self.image = Image.new(self.image_mode, (self.width, self.height), "white")
         self.draw = ImageDraw.Draw(self.image)  
-        self.update_image_bytes()
+        self.mark_frame_changed()
+        self.emit_frame()
+        self.clock.sleep(self.refresh_timing["full"])
         print("✅ Screen cleared")
 
     def display(self, image_buffer):
         """Display the updated image."""
         print("📡 Displaying Image on EPD Emulator...")
-        self.update_image_bytes()
+        self.mark_frame_changed()
+        self.emit_frame()
+        self.clock.sleep(self.refresh_timing["full"])
 
     def paste_image(self, image, box=None, mask=None):
         """Paste an image onto the simulated e-paper display."""
         print(f"🔄 Pasting Image at {box} in Emulator...")
         self.image.paste(image, box, mask)
-        self.update_image_bytes()
+        self.mark_frame_changed()
+
+    def show_frame(self, image):
+        """Show a frame decoded from a driver's byte stream (see spi_backend)."""
+        if image.size == (self.height, self.width) and self.width != self.height:
+            image = image.rotate(-90, expand=True)  # getbuffer rotated a landscape image onto a portrait panel
+        self.image = image.convert(self.image_mode)
+        self.draw = ImageDraw.Draw(self.image)
+        self.mark_frame_changed()
+        self.emit_frame()
+
+    def emit_frame(self):
+        """Hand a copy of the displayed frame to the frame sink, if there is one."""
+        if self.frame_sink is not None:
+            self.frame_sink.add(self.image.copy())
 
     def sleep(self):
         """Simulate e-paper sleep mode."""
@@ -202,5 +348,7 @@ class EPD:
     def Dev_exit(self):
         """Exit the emulator."""
         print("🔴 EPD Emulator shutting down")
-        if self.use_tkinter:
+        if self.frame_sink is not None:
+            self.frame_sink.close()
+        if self.use_tkinter and not self.headless:
             self.root.quit()  # Close Tkinter properly
@@ -0,0 +1,74 @@
+import os
+import time
+import atexit
+import threading
+
+# Where a headless emulator puts each displayed frame. Every sink has add(image) and close().
+
+
+class MemorySink:
+    """Keep frames in a list of (time.time(), image): for tests and benchmarks in the same process."""
+
+    def __init__(self):
+        self.frames = []
+        self.lock = threading.Lock()
+
+    def add(self, image):
+        with self.lock:
+            self.frames.append((time.time(), image))
+
+    def close(self):
+        pass
+
+
+class PNGDirectorySink:
+    """Write each frame to `directory` as frame_00001.png, frame_00002.png, ..."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.count = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def add(self, image):
+        self.count += 1
+        image.save(os.path.join(self.directory, f"frame_{self.count:05d}.png"))
+
+    def close(self):
+        pass
+
+
+class AnimatedStripSink:
+    """Collect frames and write them as one animated PNG or GIF (by extension) when closed or at exit."""
+
+    def __init__(self, path, frame_ms=1000):
+        self.path = path
+        self.frame_ms = frame_ms
+        self.frames = []
+        self.written = 0
+        atexit.register(self.close)
+
+    def add(self, image):
+        self.frames.append(image.convert("RGB"))
+
+    def close(self):
+        if len(self.frames) == self.written:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        first, rest = self.frames[0], self.frames[1:]
+        first.save(self.path, save_all=True, append_images=rest, duration=self.frame_ms, loop=0)
+        self.written = len(self.frames)
+        print(f"🎞 Wrote {len(self.frames)} frames to {self.path}")
+
+
+def make_sink(spec):
+    """Build a sink from a config string: "memory", "png:<directory>" or "strip:<file.png|file.gif>"."""
+    kind, _, target = spec.partition(":")
+    if kind == "memory":
+        return MemorySink()
+    if kind == "png" and target:
+        return PNGDirectorySink(target)
+    if kind == "strip" and target:
+        return AnimatedStripSink(target)
+    raise ValueError(f"Unknown frame sink: {spec!r} (use memory, png:<dir> or strip:<file>)")
@@ -0,0 +1,41 @@
+import os
+import json
+import time
+
+currentdir = os.path.dirname(os.path.realpath(__file__))
+
+# Seconds per refresh mode for each panel (driver or emulator config name), with fallbacks under "default"
+TIMING_FILE = os.path.join(currentdir, 'config', 'refresh_timing.json')
+REFRESH_MODES = ("full", "fast", "partial", "4gray")
+
+
+def load_refresh_timing(model):
+    """Return {mode: seconds} for `model`, filling in any mode it doesn't list from the defaults."""
+    with open(TIMING_FILE, 'r') as f:
+        table = json.load(f)
+    timing = dict(table["default"])
+    timing.update(table.get(model, {}))
+    return timing
+
+
+class EmulatedClock:
+    """The emulated panel's sense of time.
+
+    `speed` 0 is instant: waits are only added up, so tests and benchmarks run at full speed but
+    still know how long the panel would have taken. 1 is real time; N runs waits N times faster.
+    """
+
+    def __init__(self, speed=0):
+        self.speed = speed
+        self.started = time.monotonic()
+        self.skipped = 0.0  # Emulated seconds that passed without sleeping (instant mode)
+
+    def now(self):
+        """Emulated seconds since the clock was created."""
+        return self.skipped + (time.monotonic() - self.started) * self.speed
+
+    def sleep(self, seconds):
+        if self.speed > 0:
+            time.sleep(seconds / self.speed)
+        else:
+            self.skipped += seconds
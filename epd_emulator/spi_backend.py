@@ -0,0 +1,386 @@
+import os
+import sys
+import types
+import logging
+import argparse
+import importlib
+from PIL import Image, ImageChops
+from .refresh_timing import EmulatedClock, load_refresh_timing
+
+# Palettes, in the index order each panel family uses on the wire
+BWYR = [(0, 0, 0), (255, 255, 255), (255, 255, 0), (255, 0, 0)]
+ACEP_7 = [(0, 0, 0), (255, 255, 255), (0, 255, 0), (0, 0, 255), (255, 0, 0), (255, 255, 0), (255, 128, 0)]
+GRAY_4 = [(0, 0, 0), (85, 85, 85), (170, 170, 170), (255, 255, 255)]
+SPECTRA_6 = [(0, 0, 0), (255, 255, 255), (255, 255, 0), (255, 0, 0), (0, 0, 0), (0, 0, 255), (0, 255, 0)]
+
+
+# SSD16xx: Display Update Control 2 (0x22) option bits: drive the panel, use display mode 2 (partial),
+# and load the temperature/LUT first (left out of fast refreshes)
+SSD_UPDATE_CONTROL = 0x22
+SSD_DISPLAY_BIT = 0x04
+SSD_MODE_2_BIT = 0x08
+SSD_LOAD_LUT_BITS = 0x30
+
+# UC81xx: partial window in / out
+UC_PARTIAL_IN = 0x91
+UC_PARTIAL_OUT = 0x92
+
+# Controller families, told apart by their refresh command (SSD16xx: Master Activation 0x20, UC81xx: Display
+# Refresh 0x12), and where each keeps a frame of a given format: (planes, ink). Used for drivers without a profile.
+FAMILIES = {
+    0x20: {"1bpp": ([0x24], [0]), "bwr": ([0x24, 0x26], [0, 1])},
+    0x12: {"1bpp": ([0x13], [1]), "bwr": ([0x10, 0x13], [0, 1]), "2bpp": ([0x10], []), "4bpp": ([0x10], [])},
+}
+FAMILY_NAMES = {0x20: "SSD16xx", 0x12: "UC81xx"}
+
+# How each driver's RAM writes become pixels.
+#   format:  1bpp | bwr | 4gray | 2bpp | 4bpp
+#   planes:  the data commands holding the frame, in the order the format reads them
+#   ink:     for 1-bit planes, the bit value that means black (bwr: then red)
+#   refresh: the command that starts a refresh (0x12 on UC81xx controllers, 0x20 on SSD16xx); None until
+#            the family has been worked out from the driver's traffic (see FAMILIES)
+#   modes:   refresh mode -> (command, first data byte or None) that selects it since the last reset
+#            (SSD16xx modes come from the 0x22 option instead; UC81xx partial windows from 0x91/0x92)
+#   options: (SSD16xx) 0x22 option byte -> refresh mode, where the driver's bytes don't follow the option bits.
+#            Drivers that write their own waveform over 0x32 leave the LUT-load bits out of a full refresh (0xC7).
+#   gray:    (4gray only) the gray for each (old bit, new bit) pair, indexed by old * 2 + new.
+#            Outside "4gray" mode, planes[1] is shown as plain black and white.
+PROFILES = {
+    # 7-color ACeP and 6-color Spectra: one plane of 4-bit palette indices
+    "epd5in65f": {"format": "4bpp", "planes": [0x10], "refresh": 0x12, "palette": ACEP_7},
+    "epd4in01f": {"format": "4bpp", "planes": [0x10], "refresh": 0x12, "palette": ACEP_7},
+    "epd7in3f": {"format": "4bpp", "planes": [0x10], "refresh": 0x12, "palette": ACEP_7},
+    "epd7in3e": {"format": "4bpp", "planes": [0x10], "refresh": 0x12, "palette": SPECTRA_6},
+    # Black, white, yellow and red: one plane of 2-bit palette indices
+    "epd2in13g": {"format": "2bpp", "planes": [0x10], "refresh": 0x12, "palette": BWYR},
+    "epd2in36g": {"format": "2bpp", "planes": [0x10], "refresh": 0x12, "palette": BWYR},
+    "epd3in0g": {"format": "2bpp", "planes": [0x10], "refresh": 0x12, "palette": BWYR},
+    "epd4in37g": {"format": "2bpp", "planes": [0x10], "refresh": 0x12, "palette": BWYR},
+    "epd7in3g": {"format": "2bpp", "planes": [0x10], "refresh": 0x12, "palette": BWYR},
+    # Black and white, as 4-bit pixels of which only the four grays are used
+    "epd7in5": {"format": "4bpp", "planes": [0x10], "refresh": 0x12, "palette": GRAY_4},
+    # Black and white
+    "epd7in5_V2": {"format": "4gray", "planes": [0x10, 0x13], "refresh": 0x12, "ink": [0, 1],
+                   "modes": {"4gray": (0xE5, 0x5F), "fast": (0xE5, 0x5A), "partial": (0xE5, 0x6E)},
+                   "gray": [255, 128, 192, 0]},
+    "epd2in13_V4": {"format": "1bpp", "planes": [0x24], "refresh": 0x20, "ink": [0]},
+    "epd2in13_V3": {"format": "1bpp", "planes": [0x24], "refresh": 0x20, "ink": [0], "options": {0xC7: "full"}},
+    "epd2in9_V2": {"format": "1bpp", "planes": [0x24], "refresh": 0x20, "ink": [0], "options": {0xC7: "full"},
+                   "modes": {"4gray": (0x3C, 0x04)}},
+    # Black, white and red
+    "epd7in5b_V2": {"format": "bwr", "planes": [0x10, 0x13], "refresh": 0x12, "ink": [0, 1]},
+    "epd2in13b_V4": {"format": "bwr", "planes": [0x24, 0x26], "refresh": 0x20, "ink": [0, 0]},
+    # Black and white, or 4 grays once the 4-gray LUT is loaded
+    "epd4in2": {"format": "4gray", "planes": [0x10, 0x13], "refresh": 0x12, "ink": [0, 0],
+                "modes": {"4gray": (0x25, None)}, "gray": [0, 128, 192, 255]},
+}
+
+# Bits per pixel in each plane of a format
+PLANE_BITS = {"1bpp": 1, "bwr": 1, "4gray": 1, "2bpp": 2, "4bpp": 4}
+
+
+class SPIEmulator:
+    """Stand-in for `waveshare_epd.epdconfig` that decodes the driver's byte stream into frames.
+
+    Bytes written with DC low are commands; with DC high they are appended to the RAM plane
+    of the last command. When the profile's refresh command arrives, the planes are decoded
+    into a PIL image and handed to `on_frame`. For a driver without a profile, the controller
+    family is taken from the first refresh command that follows a full frame of RAM writes.
+    """
+
+    # Pin numbers, as in epdconfig.RaspberryPi
+    RST_PIN = 17
+    DC_PIN = 25
+    CS_PIN = 8
+    BUSY_PIN = 24
+    PWR_PIN = 18
+    MOSI_PIN = 10
+    SCLK_PIN = 11
+
+    def __init__(self, width, height, profile, on_frame=None, refresh_timing=None, clock=None):
+        self.width = width
+        self.height = height
+        self.profile = profile
+        self.on_frame = on_frame
+        self.refresh_timing = refresh_timing or load_refresh_timing("default")
+        self.clock = clock or EmulatedClock()
+        self.busy_until = 0.0  # Emulated time the current refresh ends
+        self.dc = 0
+        self.command = None
+        self.ram = {}  # data command -> bytes written since that command was last sent
+        self.busy_level = 0
+        self.SPI = types.SimpleNamespace(writebytes=self.write, writebytes2=self.write)  # Some drivers use the spidev object
+        self.frames = []  # (refresh mode, emulated seconds, decoded image) for each refresh
+        self.commands_seen = 0
+        self.bytes_written = 0
+        self.unshown_bytes = 0  # Data bytes written since the last decoded frame
+
+    # --- epdconfig interface ---
+
+    def digital_write(self, pin, value):
+        if pin == self.DC_PIN:
+            self.dc = value
+        elif pin == self.RST_PIN and not value:
+            self.ram = {}  # A hardware reset clears the controller's registers
+
+    def digital_read(self, pin):
+        if pin == self.BUSY_PIN:
+            if self.clock.now() < self.busy_until:
+                # Mid-refresh: UC81xx pull BUSY low, SSD16xx drive it high
+                return 1 if self.profile["refresh"] == 0x20 else 0
+            # Otherwise alternate: drivers disagree on the idle level, and every "wait while X" loop ends by the second poll
+            self.busy_level ^= 1
+            return self.busy_level
+        return 0
+
+    def delay_ms(self, delaytime):
+        self.clock.sleep(delaytime / 1000.0)
+
+    def spi_writebyte(self, data):
+        self.write(data)
+
+    def spi_writebyte2(self, data):
+        self.write(data)
+
+    # Drivers written for the DEV_Config C library send one byte at a time and read the controller id
+    def DEV_SPI_write(self, data):
+        self.write([data])
+
+    def DEV_SPI_nwrite(self, data):
+        self.write(data)
+
+    def DEV_SPI_read(self):
+        return 0x00  # The original controller; epd4in2b_V2 takes its UC81xx code path
+
+    def module_init(self, cleanup=False):
+        return 0
+
+    def module_exit(self, cleanup=False):
+        if self.profile["refresh"] is None and self.unshown_bytes >= self.width * self.height // 8:
+            logging.warning(f"⚠ {self.unshown_bytes} bytes of panel data were never refreshed into a frame: "
+                            f"no SSD16xx (0x24 + 0x20) or UC81xx (0x10/0x13 + 0x12) refresh was recognised")
+
+    # --- Decoding ---
+
+    def write(self, data):
+        if self.dc:
+            if self.command is not None:
+                # Drivers sometimes send ~byte (a negative int), which the SPI layer truncates to 8 bits
+                self.ram[self.command].extend(value & 0xFF for value in data)
+            self.bytes_written += len(data)
+            self.unshown_bytes += len(data)
+            return
+
+        for command in data:
+            self.commands_seen += 1
+            self.command = command
+            self.ram[command] = bytearray()
+            if command == UC_PARTIAL_OUT:
+                self.ram.pop(UC_PARTIAL_IN, None)
+            if command == self.profile["refresh"]:
+                self.refresh()
+            elif self.profile["refresh"] is None and command in FAMILIES:
+                self.detect_family(command)
+
+    def detect_family(self, command):
+        """For a driver without a profile: if RAM holds a frame where `command`'s family keeps one, adopt that family and refresh."""
+        layout = FAMILIES[command].get(self.profile["format"])
+        if layout is None or self.plane(layout[0][0], PLANE_BITS[self.profile["format"]]) is None:
+            return
+        planes, ink = layout
+        self.profile = dict(self.profile, refresh=command, planes=planes, ink=ink)
+        logging.info(f"🔎 Decoding the driver's frames as {FAMILY_NAMES[command]} "
+                     f"(planes {', '.join(f'0x{plane:02X}' for plane in planes)}, refresh 0x{command:02X})")
+        self.refresh()
+
+    def mode_selected(self, mode):
+        """Whether the driver has written the register that selects `mode` (see PROFILES) since the last reset."""
+        if mode not in self.profile.get("modes", {}):
+            return False
+        command, value = self.profile["modes"][mode]
+        data = self.ram.get(command)
+        return data is not None and (value is None or data[:1] == bytes([value]))
+
+    def refresh_mode(self):
+        """Which kind of refresh the driver asked for: full, fast, partial or 4gray."""
+        for mode in ("4gray", "partial", "fast"):
+            if self.mode_selected(mode):
+                return mode
+        if self.profile["refresh"] == 0x20:
+            option = (self.ram.get(SSD_UPDATE_CONTROL) or b"\xf7")[-1]
+            if option in self.profile.get("options", {}):
+                return self.profile["options"][option]
+            if option & SSD_MODE_2_BIT:
+                return "partial"
+            if not option & SSD_LOAD_LUT_BITS:
+                return "fast"
+        elif UC_PARTIAL_IN in self.ram:
+            return "partial"
+        return "full"
+
+    def plane(self, command, bits):
+        """One RAM plane as an 'L' image of raw values (0..2**bits-1, scaled by PIL), or None if it isn't full."""
+        data = bytes(self.ram.get(command, b""))
+        stride = len(data) // self.height if self.height else 0
+        if stride * 8 // bits < self.width:
+            return None
+        raw_mode = {1: "1", 2: "L;2", 4: "L;4"}[bits]
+        image = Image.frombytes("1" if bits == 1 else "L", (stride * 8 // bits, self.height), data[:stride * self.height], "raw", raw_mode)
+        return image.crop((0, 0, self.width, self.height)).convert("L")
+
+    def decode(self):
+        """Decode the RAM planes into an RGB image, or None if the driver hasn't written a full frame."""
+        profile = self.profile
+        fmt = profile["format"]
+        planes = [self.plane(command, PLANE_BITS[fmt]) for command in profile["planes"]]
+
+        if fmt == "4gray" and not self.mode_selected("4gray"):
+            # Without the 4-gray LUT the panel shows the new-data plane as black and white
+            fmt, planes, ink = "1bpp", planes[1:], profile["ink"][1:]
+        else:
+            ink = profile.get("ink", [])
+        if any(plane is None for plane in planes):
+            return None
+
+        if fmt == "1bpp":
+            black = planes[0] if ink[0] == 0 else planes[0].point(lambda v: 255 - v)
+            return black.convert("RGB")
+
+        if fmt == "bwr":
+            black = planes[0] if ink[0] == 0 else planes[0].point(lambda v: 255 - v)
+            red_mask = planes[1].point(lambda v: 255 if (v > 0) == bool(ink[1]) else 0)
+            frame = black.convert("RGB")
+            frame.paste((255, 0, 0), mask=red_mask)
+            return frame
+
+        if fmt == "4gray":
+            index = ImageChops.add(planes[0].point(lambda v: 2 if v else 0), planes[1].point(lambda v: 1 if v else 0))
+            return index.point(profile["gray"] + [0] * 252).convert("RGB")
+
+        # 2bpp and 4bpp planes are palette indices (PIL scales them to 0..255)
+        step = 255 // ((1 << PLANE_BITS[fmt]) - 1)
+        indices = planes[0].point(lambda v: v // step)
+        indices = indices.convert("P")
+        palette = profile["palette"]
+        indices.putpalette([channel for color in palette for channel in color] + [0, 0, 0] * (256 - len(palette)))
+        return indices.convert("RGB")
+
+    def refresh(self):
+        # SSD16xx controllers also use the refresh command to load the temperature sensor; only count real updates
+        update_control = self.ram.get(SSD_UPDATE_CONTROL)
+        if self.profile["refresh"] == 0x20 and update_control and not update_control[-1] & SSD_DISPLAY_BIT:
+            return
+        frame = self.decode()
+        if frame is None:
+            written = ", ".join(f"0x{plane:02X}: {len(self.ram.get(plane, b''))} bytes" for plane in self.profile["planes"])
+            logging.warning(f"⚠ Refresh 0x{self.profile['refresh']:02X} sent, but RAM doesn't hold a full "
+                            f"{self.width}x{self.height} {self.profile['format']} frame ({written}); nothing shown")
+            return
+        self.unshown_bytes = 0
+
+        # Hold BUSY for as long as this kind of refresh takes on the real panel
+        mode = self.refresh_mode()
+        seconds = self.refresh_timing.get(mode, self.refresh_timing["full"])
+        if self.clock.speed > 0:
+            self.busy_until = self.clock.now() + seconds
+        else:
+            self.clock.sleep(seconds)  # Instant clock: count the time, don't wait for it
+
+        self.frames.append((mode, seconds, frame))
+        if self.on_frame:
+            self.on_frame(frame)
+
+
+def profile_for(model):
+    """The decoding profile for a `waveshare_epd` driver.
+
+    Unlisted drivers get a format guessed from their name; their controller family is
+    worked out from their traffic (see SPIEmulator.detect_family).
+    """
+    if model in PROFILES:
+        return PROFILES[model]
+    base = model.split("_")[0]
+    if base.endswith("f"):
+        return {"format": "4bpp", "refresh": None, "palette": ACEP_7}
+    if base.endswith("g"):
+        return {"format": "2bpp", "refresh": None, "palette": BWYR}
+    if base.endswith(("b", "bc")):
+        return {"format": "bwr", "refresh": None}
+    return {"format": "1bpp", "refresh": None}
+
+
+def stub_gpio():
+    """Some drivers (epd4in2, epd4in2_V2) import RPi.GPIO themselves without using it; give them a stand-in off the Pi."""
+    try:
+        importlib.import_module("RPi.GPIO")
+    except (ImportError, RuntimeError):  # RPi.GPIO raises RuntimeError when imported on other hardware
+        gpio = types.ModuleType("RPi.GPIO")
+        package = types.ModuleType("RPi")
+        package.GPIO = gpio
+        sys.modules["RPi"] = package
+        sys.modules["RPi.GPIO"] = gpio
+
+
+def show(epd, emulator, image):
+    """Send an RGB image through the driver's display(), split into black and red layers for three-color drivers."""
+    image = image.convert("RGB").resize((epd.width, epd.height))
+    if emulator.profile["format"] == "bwr":
+        # Three-color drivers take a black layer and a red layer (black pixels in it are drawn red)
+        r, g, b = image.split()
+        reds = ImageChops.multiply(r.point(lambda v: 255 if v > 150 else 0),
+                                   ImageChops.lighter(g, b).point(lambda v: 255 if v < 100 else 0))
+        epd.display(epd.getbuffer(image), epd.getbuffer(ImageChops.invert(reds).convert("1")))
+    else:
+        epd.display(epd.getbuffer(image))
+
+
+def install(model, on_frame=None, clock_speed=0):
+    """Put an SPIEmulator in place of `waveshare_epd.epdconfig`, import the real driver for `model` on top of it
+    and return (driver EPD instance, emulator). `clock_speed` is passed to EmulatedClock."""
+    for name in [name for name in sys.modules if name.startswith("waveshare_epd.")]:
+        del sys.modules[name]  # Drivers bind epdconfig at import, so re-import them over the emulator
+
+    # Read the panel size from the driver source's constants without importing the real epdconfig
+    driver_path = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "waveshare_epd", f"{model}.py")
+    constants = {}
+    with open(driver_path) as driver_file:
+        for line in driver_file:
+            if line.startswith(("EPD_WIDTH", "EPD_HEIGHT")):
+                name, value = line.split("=", 1)
+                constants[name.strip()] = int(value.split("#")[0])
+
+    emulator = SPIEmulator(constants["EPD_WIDTH"], constants["EPD_HEIGHT"], profile_for(model), on_frame,
+                           load_refresh_timing(model), EmulatedClock(clock_speed))
+
+    # Expose the emulator as a module, the same way epdconfig exposes its platform implementation
+    module = types.ModuleType("waveshare_epd.epdconfig")
+    for func in [x for x in dir(emulator) if not x.startswith('_')]:
+        setattr(module, func, getattr(emulator, func))
+    module.implementation = emulator
+    sys.modules["waveshare_epd.epdconfig"] = module
+    stub_gpio()
+    package = importlib.import_module("waveshare_epd")
+    package.epdconfig = module
+
+    driver = importlib.import_module(f"waveshare_epd.{model}").EPD()
+    return driver, emulator
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a Waveshare driver on the SPI emulator and save what the panel would show")
+    parser.add_argument("model", help="Driver module in waveshare_epd, e.g. epd7in3f")
+    parser.add_argument("image", help="Image to display")
+    parser.add_argument("output", help="Where to save the decoded frame (PNG)")
+    parser.add_argument("--clock", type=float, default=0, help="0 = instant (default), 1 = real time, N = N times faster")
+    args = parser.parse_args()
+
+    epd, emulator = install(args.model, clock_speed=args.clock)
+    epd.init()
+    show(epd, emulator, Image.open(args.image))
+    if not emulator.frames:
+        print(f"❌ {args.model} did not produce a decodable frame.")
+        sys.exit(1)
+    mode, seconds, frame = emulator.frames[-1]
+    frame.save(args.output)
+    print(f"✅ Decoded {emulator.bytes_written} data bytes ({emulator.commands_seen} commands) → {args.output}")
+    print(f"⏱ {mode} refresh: {seconds:.1f}s; {emulator.clock.now():.1f}s of panel time in all")
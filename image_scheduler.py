@@ -0,0 +1,252 @@
+import os
+import time
+import random
+import struct
+import hashlib
+import logging
+from array import array
+from datetime import datetime
+from config import CONFIG
+from state_store import load_json_state, save_json_state, atomic_write_bytes
+
+# The deck is a binary file of uint32 indices into the sorted library, behind a small header holding the
+# deck id. 100k images cost ~400 KB on disk, and each pick only reads a few records. The sorted keys the
+# indices refer to are kept beside it, so a library change can be merged into the deck instead of replacing it.
+DECK_HEADER = struct.Struct("<Q")
+DECK_RECORD = array("I").itemsize
+
+# Recently shown keys kept in the state file; up to half a library's worth go to the back of any new deck
+HISTORY_SIZE = 256
+
+# Each pick chooses among the next few deck entries, which is where time-of-day weighting applies
+PICK_WINDOW = 8
+
+# Favorites appear this many times per pass through the library
+FAVORITE_COPIES = 2
+
+# Images added in the last RECENT_DAYS are shuffled towards the front of the deck
+RECENT_DAYS = 14
+RECENT_WEIGHT = 3.0
+
+# Images tagged with "@morning", "@day", "@evening" or "@night" in their name prefer that part of the day
+TIME_OF_DAY = {
+    "morning": (5, 11),
+    "day": (11, 17),
+    "evening": (17, 22),
+    "night": (22, 5),
+}
+TIME_MATCH_WEIGHT = 4.0
+TIME_MISMATCH_WEIGHT = 0.25
+
+
+def _state_paths(source):
+    base = os.path.join(CONFIG["CACHE_DIR"], f"schedule_{source}")
+    return f"{base}.json", f"{base}.deck", f"{base}.keys"
+
+
+def current_period(hour=None):
+    """Return the time-of-day tag for an hour (defaults to now)."""
+    hour = datetime.now().hour if hour is None else hour
+    for period, (start, end) in TIME_OF_DAY.items():
+        if (start <= hour < end) if start < end else (hour >= start or hour < end):
+            return period
+    return None
+
+
+def load_favorites():
+    """Read the favorites file: one image name per line."""
+    try:
+        with open(CONFIG["FAVORITES_FILE"], "r") as favorites_file:
+            return {line.strip() for line in favorites_file if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+def _time_weight(name, period):
+    tags = [tag for tag in TIME_OF_DAY if f"@{tag}" in name.lower()]
+    if not tags:
+        return 1.0
+    return TIME_MATCH_WEIGHT if period in tags else TIME_MISMATCH_WEIGHT
+
+
+def _entry_weight(added, recent_cutoff):
+    return RECENT_WEIGHT if added and added > recent_cutoff else 1.0
+
+
+def _build_deck(keys, describe, history, rng):
+    """Weighted shuffle of the library (Efraimidis-Spirakis keys): recent images sort earlier, favorites appear twice.
+
+    The most recently shown keys (up to half the library) go to the back of the deck in the order they were
+    shown, so none of them comes back before the rest of the library. Only a favorite's first copy is held back.
+    """
+    favorites = load_favorites()
+    recent_cutoff = time.time() - RECENT_DAYS * 24 * 60 * 60
+    held_back = {}
+    for key in reversed(history):
+        if len(held_back) >= len(keys) // 2:
+            break
+        held_back.setdefault(key, len(held_back))  # 0 = shown last
+
+    entries, back = [], []
+    for index, key in enumerate(keys):
+        name, added = describe(key)
+        weight = _entry_weight(added, recent_cutoff)
+        for copy in range(FAVORITE_COPIES if name in favorites else 1):
+            if copy == 0 and key in held_back:
+                back.append((held_back[key], index))
+            else:
+                entries.append((rng.random() ** (1.0 / weight), index))
+
+    entries.sort(reverse=True)
+    back.sort(reverse=True)
+    return array("I", [index for _, index in entries] + [index for _, index in back])
+
+
+def _merge_library(deck, cursor, taken, old_keys, keys, describe, rng):
+    """Carry the unshown part of `deck` (indices into `old_keys`) over to the library `keys`.
+
+    Removed images are dropped, images shown this pass stay shown, and new images are dealt into
+    random places among the unshown ones (recent ones towards the front, favorites twice).
+    """
+    position = {key: index for index, key in enumerate(keys)}
+    unshown = [
+        position[old_keys[index]]
+        for offset, index in enumerate(deck[cursor:], cursor)
+        if offset not in taken and old_keys[index] in position
+    ]
+
+    favorites = load_favorites()
+    recent_cutoff = time.time() - RECENT_DAYS * 24 * 60 * 60
+    known = set(old_keys)
+    inserts = []
+    for index, key in enumerate(keys):
+        if key in known:
+            continue
+        name, added = describe(key)
+        weight = _entry_weight(added, recent_cutoff)
+        for _ in range(FAVORITE_COPIES if name in favorites else 1):
+            inserts.append((int(len(unshown) * rng.random() ** weight), index))
+
+    merged, inserts = [], sorted(inserts)
+    next_insert = 0
+    for slot, index in enumerate(unshown + [None]):
+        while next_insert < len(inserts) and inserts[next_insert][0] <= slot:
+            merged.append(inserts[next_insert][1])
+            next_insert += 1
+        if index is not None:
+            merged.append(index)
+    return array("I", merged), len(inserts)
+
+
+def _write_deck(deck_path, keys_path, deck_id, deck, keys):
+    atomic_write_bytes(deck_path, DECK_HEADER.pack(deck_id) + deck.tobytes())
+    atomic_write_bytes(keys_path, "\n".join([str(deck_id)] + keys).encode("utf-8"))
+
+
+def _read_deck(deck_path, keys_path, deck_id):
+    """Read the whole deck and the keys it indexes, or (None, None) if either doesn't match the state."""
+    try:
+        with open(keys_path, "rb") as keys_file:
+            lines = keys_file.read().decode("utf-8").split("\n")
+        with open(deck_path, "rb") as deck_file:
+            header = deck_file.read(DECK_HEADER.size)
+            records = deck_file.read()
+    except FileNotFoundError:
+        return None, None
+    if lines[0] != str(deck_id) or len(header) != DECK_HEADER.size or DECK_HEADER.unpack(header)[0] != deck_id:
+        return None, None
+    deck = array("I")
+    deck.frombytes(records)
+    return deck, lines[1:]
+
+
+def _read_deck_window(deck_path, deck_id, start, count):
+    """Read `count` deck records starting at `start`, or None if the deck file doesn't match the state."""
+    try:
+        with open(deck_path, "rb") as deck_file:
+            header = deck_file.read(DECK_HEADER.size)
+            if len(header) != DECK_HEADER.size or DECK_HEADER.unpack(header)[0] != deck_id:
+                return None
+            deck_file.seek(DECK_HEADER.size + start * DECK_RECORD)
+            window = array("I")
+            window.frombytes(deck_file.read(count * DECK_RECORD))
+            return window
+    except FileNotFoundError:
+        return None
+
+
+def reserve_next(source, keys, describe):
+    """Pick the next image for `source` without repeats until the whole library has been shown.
+
+    `keys` are the library's stable identifiers (Drive file ids or paths) and `describe(key)`
+    returns `(name, added_timestamp)`. The deck and cursor are persisted under CACHE_DIR,
+    so the order survives power-off. Images added or removed mid-pass are merged into the
+    current deck; a new shuffle is only dealt once the deck is exhausted.
+
+    Returns `(key, commit)`: the deck only advances when `commit()` is called, so when several
+    sources race only the winner's pick counts.
+    """
+    keys = sorted(keys)
+    if not keys:
+        return None, lambda: None
+
+    state_path, deck_path, keys_path = _state_paths(source)
+    library = hashlib.sha1("\n".join(keys).encode("utf-8")).hexdigest()
+    state = load_json_state(state_path, {})
+    history = state.get("history", [])
+    rng = random.Random()
+
+    if state.get("deck_id") is not None and state.get("library") != library and state.get("cursor", 0) < state.get("length", 0):
+        deck, old_keys = _read_deck(deck_path, keys_path, state["deck_id"])
+        if deck is not None:
+            deck, added = _merge_library(deck, state["cursor"], set(state["taken"]), old_keys, keys, describe, rng)
+            logging.info(f"🔀 {source.title()} library changed. {len(deck)} images left this pass ({added} new).")
+            state.update(library=library, deck_id=rng.getrandbits(63), length=len(deck), cursor=0, taken=[])
+            _write_deck(deck_path, keys_path, state["deck_id"], deck, keys)
+
+    window = None
+    if state.get("library") == library and state.get("cursor", 0) < state.get("length", 0):
+        window = _read_deck_window(
+            deck_path, state["deck_id"], state["cursor"], min(PICK_WINDOW, state["length"] - state["cursor"])
+        )
+
+    if window is None:
+        if not state:
+            logging.info(f"🔀 Dealing the first {source} deck of {len(keys)} images.")
+        elif state.get("library") == library:
+            logging.info(f"🔀 Every {source} image has been shown. Reshuffling {len(keys)} images.")
+        else:
+            logging.info(f"🔀 {source.title()} library changed. Dealing a new deck of {len(keys)} images.")
+        deck = _build_deck(keys, describe, history, rng)
+        state = {
+            "library": library,
+            "deck_id": rng.getrandbits(63),
+            "length": len(deck),
+            "cursor": 0,
+            "taken": [],
+            "history": history,
+            "cycle": state.get("cycle", 0) + 1,
+        }
+        _write_deck(deck_path, keys_path, state["deck_id"], deck, keys)
+        window = deck[:PICK_WINDOW]
+
+    # Choose among the next few untaken entries, weighted by time of day and avoiding back-to-back repeats
+    period = current_period()
+    recent = set(history[-PICK_WINDOW:])
+    candidates = [
+        (offset, keys[index])
+        for offset, index in enumerate(window)
+        if state["cursor"] + offset not in state["taken"]
+    ]
+    fresh = [candidate for candidate in candidates if candidate[1] not in recent] or candidates
+    weights = [_time_weight(describe(key)[0], period) for _, key in fresh]
+    offset, selected = rng.choices(fresh, weights=weights)[0]
+
+    # Skip the cursor past every entry that has now been taken
+    state["taken"].append(state["cursor"] + offset)
+    while state["cursor"] in state["taken"]:
+        state["taken"].remove(state["cursor"])
+        state["cursor"] += 1
+
+    state["history"] = (history + [selected])[-HISTORY_SIZE:]
+    return selected, lambda: save_json_state(state_path, state)
@@ -1,14 +1,18 @@
 import os
-import random
-import io
+import re
+import time
+import queue
 import logging
+import threading
+from datetime import datetime
 import socket
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
-from google.oauth2 import service_account
-import google.auth.transport.requests
-import googleapiclient.discovery
+import timing
 from config import CONFIG  # Import entire config dictionary
+from drive_manifest import sync_manifest
+from drive_session import get_drive_session, has_drive_session
+from drive_download import download_media, check_cancelled, DownloadCancelled
+import drive_mirror
+from image_scheduler import reserve_next
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -16,39 +20,69 @@ logging.basicConfig(level=logging.INFO)
 # Allowed image formats
 VALID_EXTENSIONS = ('.bmp', '.png', '.jpg', '.jpeg', '.jfif', '.webp')
 
+# Thumbnails are requested slightly larger than the panel so resizing still has detail to work with
+THUMBNAIL_MARGIN = 1.1
+
+# Result of the connectivity probe, shared by the source race and Drive auth
+_internet_available = None
+
+# Set once the network probe or Drive auth fails, so later calls in this run don't pay for it again
+_drive_offline = False
+
+# The background Drive fetch of the last source race and the event that tells it to stop
+_drive_worker = None
+_drive_cancel = None
+
 def is_internet_available():
-    """Check if internet is available by pinging a reliable server."""
-    try:
-        socket.create_connection(("8.8.8.8", 53), timeout=2)
-        return True
-    except OSError:
-        return False
+    """Check if internet is available by pinging a reliable server (once per run)."""
+    global _internet_available
+    if _internet_available is None:
+        with timing.span("network_probe"):
+            try:
+                with socket.create_connection(("8.8.8.8", 53), timeout=2):
+                    _internet_available = True
+            except OSError:
+                _internet_available = False
+    return _internet_available
+
+def reset_network_state():
+    """Forget this run's probe and auth failures, so a long-running process re-checks the network next time."""
+    global _internet_available, _drive_offline
+    _internet_available = None
+    _drive_offline = False
 
 def authenticate_drive():
-    """Authenticate and return Google Drive service without using deprecated file_cache."""
-    if not is_internet_available():
+    """Return the process-wide Google Drive service, creating it (and probing the network) only once."""
+    global _drive_offline
+
+    if has_drive_session():
+        return get_drive_session().service
+    if _drive_offline:
+        return None
+
+    # A local stand-in endpoint doesn't need the public internet
+    if not CONFIG["DRIVE_API_ENDPOINT"] and not is_internet_available():
         logging.warning("⚠ No internet connection. Falling back to local images.")
+        _drive_offline = True
         return None
 
     try:
-        creds = service_account.Credentials.from_service_account_file(CONFIG["SERVICE_ACCOUNT_FILE"])
-        return googleapiclient.discovery.build("drive", "v3", credentials=creds, cache_discovery=False)
+        return get_drive_session().service
     except Exception as e:
         logging.error(f"❌ Google Drive authentication failed: {e}")
+        _drive_offline = True
         return None
 
+@timing.timed("drive_list")
 def get_drive_image_files():
-    """Fetch available image files from Google Drive."""
+    """Fetch available image files from Google Drive via the persistent manifest."""
     drive_service = authenticate_drive()
     if not drive_service:
         return []
 
     try:
-        results = drive_service.files().list(
-            q=f"'{CONFIG['DRIVE_FOLDER_ID']}' in parents and (mimeType contains 'image/')",
-            fields="files(id, name)"
-        ).execute()
-        files = results.get("files", [])
+        manifest = sync_manifest(drive_service, CONFIG["DRIVE_FOLDER_ID"])
+        files = [dict(entry, id=file_id) for file_id, entry in manifest["files"].items()]
         if not files:
             logging.warning("⚠ No images found in Google Drive.")
         return files
@@ -56,23 +90,88 @@ def get_drive_image_files():
         logging.error(f"❌ Error retrieving images from Google Drive: {e}")
         return []
 
-def fetch_drive_image(file_id):
-    """Stream image from Google Drive."""
+def thumbnail_size():
+    """Longest side to request from Drive's thumbnail service: just above the panel's longest side."""
+    return int(max(CONFIG["TARGET_SIZE"]) * THUMBNAIL_MARGIN)
+
+def get_thumbnail_link(drive_service, drive_file):
+    """Return a thumbnail URL sized for the panel, or None when the original should be downloaded instead."""
+    if CONFIG["DRIVE_FETCH_ORIGINAL"]:
+        return None
+
+    metadata = drive_service.files().get(
+        fileId=drive_file["id"],
+        fields="hasThumbnail, thumbnailLink, imageMediaMetadata(width, height)"
+    ).execute()
+    link = metadata.get("thumbnailLink")
+    if not metadata.get("hasThumbnail") or not link:
+        return None
+
+    # A thumbnail can't add detail to an image that is already no bigger than it
+    dimensions = metadata.get("imageMediaMetadata", {})
+    longest_side = max(dimensions.get("width", 0), dimensions.get("height", 0))
+    if longest_side and longest_side <= thumbnail_size():
+        return None
+
+    # Thumbnail links end in "=s220"; ask for the panel-sized rendition instead
+    return re.sub(r"=s\d+$", "", link) + f"=s{thumbnail_size()}"
+
+@timing.timed("download")
+def fetch_drive_image(drive_file, cancel=None):
+    """Return a local path to a Drive image, downloading it into the mirror only if this version isn't there yet.
+
+    A panel-sized thumbnail is downloaded when Drive has one; the full file is used otherwise.
+    Setting the `cancel` event stops the download and leaves the mirror index untouched.
+    """
+    # md5Checksum changes whenever the content does, so a matching mirror entry is always current
+    version = drive_file.get("md5Checksum") or drive_file.get("modifiedTime") or "unversioned"
+    thumbnail_version = f"{version}-s{thumbnail_size()}"
+
+    candidates = (version,) if CONFIG["DRIVE_FETCH_ORIGINAL"] else (thumbnail_version, version)
+    for candidate in candidates:
+        cached_path = drive_mirror.lookup(drive_file["id"], candidate)
+        if cached_path:
+            logging.info(f"💾 Using mirrored copy of {drive_file['name']}")
+            return cached_path
+
     drive_service = authenticate_drive()
     if not drive_service:
         return None
 
     try:
-        request = drive_service.files().get_media(fileId=file_id)
-        img_data = io.BytesIO()
-        downloader = MediaIoBaseDownload(img_data, request)
-        
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-
-        img_data.seek(0)
-        return img_data
+        started = time.monotonic()
+        thumbnail_link = get_thumbnail_link(drive_service, drive_file)
+
+        transferred = 0
+
+        if thumbnail_link:
+            def download(part_path):
+                nonlocal transferred
+                check_cancelled(cancel)
+                response, content = get_drive_session().request(thumbnail_link)
+                if response.status != 200:
+                    raise IOError(f"thumbnail request returned HTTP {response.status}")
+                with open(part_path, "wb") as part_file:
+                    part_file.write(content)
+                transferred = len(content)
+
+            path = drive_mirror.store(drive_file["id"], thumbnail_version, drive_file["name"], download, cancel)
+        else:
+            def download(part_path):
+                nonlocal transferred
+                transferred = download_media(drive_file["id"], part_path, drive_file.get("size"), cancel)
+
+            path = drive_mirror.store(drive_file["id"], version, drive_file["name"], download, cancel)
+
+        logging.info(
+            f"📥 Downloaded {'thumbnail' if thumbnail_link else 'original'} of {drive_file['name']}: "
+            f"{transferred / 1024:.0f} KB transferred (original {drive_file.get('size', 0) / 1024:.0f} KB) "
+            f"in {time.monotonic() - started:.2f}s"
+        )
+        return path
+    except DownloadCancelled:
+        logging.info(f"🛑 Stopped downloading {drive_file['name']}: an offline image was used instead")
+        return None
     except Exception as e:
         logging.error(f"❌ Error downloading image from Google Drive: {e}")
         return None
@@ -89,29 +188,137 @@ def get_local_image_files():
         logging.error(f"❌ Error accessing local images: {e}")
         return []
 
+def _drive_modified_timestamp(drive_file):
+    """Parse a Drive modifiedTime (RFC 3339) into a Unix timestamp, or None."""
+    try:
+        return datetime.fromisoformat(drive_file["modifiedTime"].replace("Z", "+00:00")).timestamp()
+    except (KeyError, AttributeError, ValueError):
+        return None
+
+def _local_modified_timestamp(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+def _prepare_offline_candidate(source):
+    """Reserve the next image that needs no network: the Drive mirror first (for Drive setups), then local storage.
+
+    Returns (path, title, commit) or None.
+    """
+    if source == "drive":
+        mirrored = dict(drive_mirror.cached_images())
+        if mirrored:
+            selected_path, commit = reserve_next(
+                "mirror", mirrored, lambda path: (mirrored[path], _local_modified_timestamp(path))
+            )
+            return selected_path, mirrored[selected_path], commit
+
+    images = get_local_image_files()
+    if images:
+        selected, commit = reserve_next(
+            "local", images, lambda path: (os.path.basename(path), _local_modified_timestamp(path))
+        )
+        return selected, os.path.basename(selected), commit
+    return None
+
+def _resolve_drive_image(events, cancel):
+    """Probe the network, sync the manifest and download the next Drive image, reporting progress on `events`.
+
+    Stops early (returning None) once `cancel` is set.
+    """
+    if not CONFIG["DRIVE_API_ENDPOINT"] and not is_internet_available():
+        logging.warning("⚠ No internet connection. Falling back to offline images.")
+        return None
+    events.put(("online", None))
+
+    if cancel.is_set():
+        return None
+    images = {image["id"]: image for image in get_drive_image_files()}
+    if not images or cancel.is_set():
+        return None
+
+    file_id, commit = reserve_next(
+        "drive", images, lambda file_id: (images[file_id]["name"], _drive_modified_timestamp(images[file_id]))
+    )
+    selected = images[file_id]
+    logging.info(f"📂 Selected Drive image: {selected['name']}")
+    image_data = fetch_drive_image(selected, cancel)
+    return (image_data, selected["name"], commit) if image_data else None
+
+def _stop_drive_worker():
+    """Cancel the Drive fetch left over from the last race and wait for it to stop.
+
+    It shares the Drive connection and the mirror index, so it must be gone before the next fetch starts.
+    """
+    global _drive_worker
+    if _drive_worker is None:
+        return
+    _drive_cancel.set()
+    if _drive_worker.is_alive():
+        logging.info("⏳ Waiting for the previous Drive fetch to stop...")
+        _drive_worker.join()
+    _drive_worker = None
+
+def _race_drive_against_offline():
+    """Run the Drive path in the background while the offline candidate is prepared, and return the winner.
+
+    Drive wins if the network probe answers within NETWORK_PROBE_TIMEOUT and the image arrives within
+    DRIVE_FETCH_TIMEOUT; otherwise the offline candidate is used straight away, so an offline wake never
+    waits on a network timeout. A Drive fetch that loses is cancelled; it stops at its next chunk and is
+    joined before the next race starts.
+    """
+    global _drive_worker, _drive_cancel
+    _stop_drive_worker()
+    events = queue.Queue()
+    cancel = threading.Event()
+
+    def drive_worker():
+        try:
+            events.put(("done", _resolve_drive_image(events, cancel)))
+        except Exception as e:
+            logging.error(f"❌ Error fetching image from Google Drive: {e}")
+            events.put(("done", None))
+
+    # Daemon thread: a slow download that lost the race must not keep the process alive
+    _drive_worker = threading.Thread(target=drive_worker, name="drive-source", daemon=True)
+    _drive_cancel = cancel
+    _drive_worker.start()
+    offline = _prepare_offline_candidate("drive")
+
+    deadline = time.monotonic() + CONFIG["NETWORK_PROBE_TIMEOUT"]
+    while True:
+        try:
+            event, result = events.get(timeout=max(0, deadline - time.monotonic()))
+        except queue.Empty:
+            logging.warning("⏱ Google Drive didn't answer in time. Using an offline image.")
+            cancel.set()
+            return offline
+        if event == "online":
+            deadline = time.monotonic() + CONFIG["DRIVE_FETCH_TIMEOUT"]
+        elif result:
+            return result
+        else:
+            return offline
+
 def get_random_image():
-    """Fetch a random image from the selected source.
+    """Fetch the next image from the selected source, using the no-repeat shuffle scheduler.
     
     Returns:
         A tuple (image_data, image_title).
-        - For Drive images, image_data is a BytesIO stream and image_title is the Drive file name.
+        - For Drive images, image_data is the path of the mirrored file and image_title is the Drive file name.
         - For local images, image_data is the file path and image_title is the basename.
     """
     if CONFIG["IMAGE_SOURCE"] == "drive":
-        images = get_drive_image_files()
-        if images:
-            selected = random.choice(images)
-            logging.info(f"📂 Selected Drive image: {selected['name']}")
-            image_data = fetch_drive_image(selected["id"])
-            return image_data, selected["name"]
-        logging.warning("⚠ No images found in Google Drive. Switching to local storage.")
-
-    # Fallback to local storage
-    images = get_local_image_files()
-    if images:
-        selected = random.choice(images)
-        logging.info(f"🖼 Selected Local image: {selected}")
-        return selected, os.path.basename(selected)
+        selected = _race_drive_against_offline()
+    else:
+        selected = _prepare_offline_candidate("local")
+
+    if selected is None:
+        logging.error("❌ No images found in both Google Drive and local storage.")
+        return None, None
 
-    logging.error("❌ No images found in both Google Drive and local storage.")
-    return None, None
+    image_data, image_title, commit = selected
+    commit()
+    logging.info(f"🖼 Selected image: {image_title} ({image_data})")
+    return image_data, image_title
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import os
+import sys
+import gzip
+import shutil
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+
+# ✅ The wake log is append-only; once it passes LOG_ROTATE_MB it is rotated and older copies are gzipped
+LOG_ROTATE_BYTES = int(float(os.getenv("LOG_ROTATE_MB", 5)) * 1024 * 1024)
+LOG_KEEP = int(os.getenv("LOG_KEEP", 5))  # rotated copies kept: <log>.1, then <log>.2.gz ... <log>.N.gz
+
+
+def _compress(source, target):
+    """Gzip `source` into `target` (via a temp file, so a power cut never leaves a truncated archive)."""
+    tmp_path = f"{target}.tmp"
+    with open(source, "rb") as src, gzip.open(tmp_path, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(tmp_path, target)
+    os.remove(source)
+
+
+def rotate_log(log_path, max_bytes=LOG_ROTATE_BYTES, keep=LOG_KEEP):
+    """Rotate `log_path` if it has grown past `max_bytes`. Returns True if it was rotated.
+
+    The log is renamed (not copied) to `<log>.1`, so log shipping can still find the lines it
+    hasn't uploaded yet by inode. The previous `<log>.1` is compressed to `<log>.2.gz`, and
+    anything beyond `keep` copies is deleted. Call this before anything opens the log for the wake.
+    """
+    try:
+        if os.path.getsize(log_path) < max_bytes:
+            return False
+    except FileNotFoundError:
+        return False
+
+    if keep < 1:
+        os.remove(log_path)
+        return True
+
+    # Shift <log>.2.gz ... <log>.N.gz up by one, dropping the oldest
+    if os.path.exists(f"{log_path}.{keep}.gz"):
+        os.remove(f"{log_path}.{keep}.gz")
+    for index in range(keep - 1, 1, -1):
+        if os.path.exists(f"{log_path}.{index}.gz"):
+            os.replace(f"{log_path}.{index}.gz", f"{log_path}.{index + 1}.gz")
+
+    if os.path.exists(f"{log_path}.1"):
+        if keep > 1:
+            _compress(f"{log_path}.1", f"{log_path}.2.gz")
+        else:
+            os.remove(f"{log_path}.1")
+
+    os.replace(log_path, f"{log_path}.1")
+    logging.info(f"🗂 Rotated {log_path} (over {max_bytes / 1024 / 1024:.1f} MB)")
+    return True
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        logging.error("❌ No log file specified.")
+        sys.exit(1)
+    rotate_log(sys.argv[1])
@@ -3,9 +3,14 @@ import os
 import json
 import logging
 import subprocess
+import threading
+import collections
 import time
 import paho.mqtt.client as mqtt
 from dotenv import load_dotenv
+from display_service import request_display
+from pisugar import PiSugarClient
+from ota_update import check_for_update
 
 # ✅ Load environment variables
 load_dotenv()
@@ -31,101 +36,248 @@ PISUGAR_COMMANDS = {
     "auth", "anti_mistouch", "soft_poweroff", "soft_poweroff_shell", "input_protect"
 }
 
+# ✅ Command queue limits
+COMMAND_QUEUE_SIZE = 8
+
 def run_command(command):
-    """Helper function to execute shell commands."""
+    """Helper function to execute shell commands. Returns True on success."""
     try:
         subprocess.run(command, shell=True, check=True)
+        return True
     except subprocess.CalledProcessError as e:
         logging.error(f"❌ Command failed: {command}, Error: {e}")
+        return False
 
-def send_mqtt_response(topic, message):
-    """Send a response message back to MQTT for command acknowledgment."""
-    client = mqtt.Client()
+def run_display(image_path=None):
+    """Render via the resident display service, falling back to a fresh display.py process."""
+    result = request_display(image_path)
+    if result is None:
+        logging.info("ℹ️ Display service not running. Starting display.py...")
+        command = f"python3 {SCRIPT_DIR}/display.py"
+        if image_path:
+            command += f" --image '{image_path}'"
+        return run_command(command)
+    if result["ok"]:
+        logging.info(f"✅ Display service showed {result['image']} in {result['seconds']}s")
+    else:
+        logging.error(f"❌ Display service error: {result['error']}")
+    return result["ok"]
 
-    if MQTT_USERNAME and MQTT_PASSWORD:
-        client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+class CommandQueue:
+    """Bounded FIFO of pending commands, where a new refresh replaces one that is still waiting."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.pending = collections.deque()
+        self.condition = threading.Condition()
+
+    def put(self, payload, coalesce_key=None):
+        """Queue a command. Returns "queued", "coalesced" or "full"."""
+        with self.condition:
+            if coalesce_key:
+                for job in self.pending:
+                    if job["coalesce_key"] == coalesce_key:
+                        logging.info(f"🔁 Replacing queued '{job['payload']}' with '{payload}'")
+                        job["payload"] = payload
+                        job["coalesced"] += 1
+                        return "coalesced"
+
+            if len(self.pending) >= self.maxsize:
+                return "full"
+
+            self.pending.append({
+                "payload": payload,
+                "coalesce_key": coalesce_key,
+                "coalesced": 0,
+                "received_at": time.monotonic(),
+            })
+            self.condition.notify()
+            return "queued"
+
+    def get(self):
+        """Block until a command is available and return it."""
+        with self.condition:
+            while not self.pending:
+                self.condition.wait()
+            return self.pending.popleft()
+
+    def __len__(self):
+        with self.condition:
+            return len(self.pending)
+
+command_queue = CommandQueue(COMMAND_QUEUE_SIZE)
 
+# The listener's persistent connection, shared by responses and metrics
+mqtt_client = None
+
+def publish_queue_metrics(client, job=None, started_at=None):
+    """Publish queue depth (and, after a command, its wait and total latency) for monitoring."""
+    try:
+        client.publish(f"{MQTT_TOPIC_PREFIX}/listener/queue_depth", len(command_queue), retain=True)
+        if job:
+            finished_at = time.monotonic()
+            client.publish(f"{MQTT_TOPIC_PREFIX}/listener/queue_wait", round(started_at - job["received_at"], 2), retain=True)
+            client.publish(f"{MQTT_TOPIC_PREFIX}/listener/latency", round(finished_at - job["received_at"], 2), retain=True)
+    except Exception as e:
+        logging.error(f"❌ Failed to publish queue metrics: {e}")
+
+def command_worker(client):
+    """Run queued commands one at a time, off the MQTT network loop."""
+    while True:
+        job = command_queue.get()
+        started_at = time.monotonic()
+        publish_queue_metrics(client)
+
+        try:
+            ok = handle_command(job["payload"])
+        except Exception as e:
+            logging.error(f"❌ Command '{job['payload']}' crashed: {e}")
+            ok = False
+
+        send_mqtt_response("result", json.dumps({
+            "command": job["payload"],
+            "ok": bool(ok),
+            "coalesced": job["coalesced"],
+            "seconds": round(time.monotonic() - job["received_at"], 2),
+        }))
+        publish_queue_metrics(client, job, started_at)
+
+def send_mqtt_response(topic, message):
+    """Send a response message back to MQTT for command acknowledgment, over the listener's own connection."""
     try:
-        client.connect(MQTT_BROKER, MQTT_PORT, 60)
         response_topic = f"{MQTT_TOPIC_PREFIX}/response/{topic}"
-        client.publish(response_topic, message, retain=False)
-        client.disconnect()
+        mqtt_client.publish(response_topic, message, qos=1, retain=False)
         logging.info(f"📡 Sent MQTT response: {response_topic} → {message}")
     except Exception as e:
         logging.error(f"❌ Failed to send MQTT response: {e}")
 
+def coalesce_key(payload):
+    """Commands that refresh the panel share a key: only the latest queued refresh is worth running."""
+    if payload in ("display", "update_display") or payload.startswith("set_image:"):
+        return "refresh"
+    return None
+
 def on_message(client, userdata, msg):
-    """Handle incoming MQTT messages for controlling the ePaper frame."""
+    """Queue incoming MQTT commands; the worker thread runs them so the network loop never blocks."""
     payload = msg.payload.decode("utf-8").strip()
     logging.info(f"📥 Received MQTT command: {msg.topic} → {payload}")
 
-    if payload == "shutdown":
-        logging.info("🛑 Shutting down system via MQTT...")
-        send_mqtt_response("shutdown", "Shutting down...")
-        run_command("sudo shutdown now")
-
-    elif payload == "display":
-        logging.info("📺 Running display.py via MQTT...")
-        send_mqtt_response("display", "Updating display...")
-        run_command("python3 /home/kenneth/epaper-frame/display.py")
-
-    elif payload == "update_display":
-        logging.info("🔄 Running `run_update_and_display.sh` via MQTT...")
-        send_mqtt_response("update_display", "Running update and display script...")
-        run_command(f"bash {SCRIPT_DIR}/run_update_and_display.sh")
-
-    elif payload.startswith("set_image:"):
-        image_name = payload.replace("set_image:", "").strip()
-        image_path = os.path.join(IMAGE_DIR, image_name)
-
-        if os.path.exists(image_path):
-            logging.info(f"🖼️ Setting display to {image_name} via MQTT...")
-            send_mqtt_response("set_image", f"Displaying {image_name}")
-            run_command(f"python3 /home/kenneth/epaper-frame/display.py --image '{image_path}'")
-        else:
+    status = command_queue.put(payload, coalesce_key(payload))
+    if status == "full":
+        logging.warning(f"⚠️ Command queue full. Dropping: {payload}")
+        client.publish(f"{MQTT_TOPIC_PREFIX}/response/busy", f"Error: queue full, dropped {payload}")
+    publish_queue_metrics(client)
+
+def parse_pisugar_setting(payload):
+    """Split "set_pisugar:<setting>:<value>" into a valid setting and a PiSugar-style value. Raises ValueError."""
+    try:
+        _, setting, value = payload.split(":")
+    except ValueError:
+        raise ValueError(f"Invalid set_pisugar command format: {payload}")
+
+    setting = setting.strip()
+    value = value.strip().lower()
+    if setting not in PISUGAR_COMMANDS:
+        raise ValueError(f"Invalid PiSugar setting: {setting}")
+
+    # Convert value for PiSugar compatibility
+    if value in ["true", "on", "enable", "enabled"]:
+        value = "true"
+    elif value in ["false", "off", "disable", "disabled"]:
+        value = "false"
+    return setting, value
+
+class CommandHandler:
+    """Runs one MQTT command for controlling the ePaper frame.
+
+    The listener uses it as is. The agent overrides how responses, renders, scripts and PiSugar
+    commands are carried out, so it can reuse its shared connections and warm panel driver.
+    """
+
+    def respond(self, topic, message):
+        send_mqtt_response(topic, message)
+
+    def render(self, image_path=None):
+        return run_display(image_path)
+
+    def run_script(self, command):
+        return run_command(command)
+
+    def pisugar_command(self, command):
+        with PiSugarClient() as pisugar:
+            return pisugar.command(command)
+
+    def handle(self, payload):
+        """Execute one command. Returns True on success."""
+        if payload == "shutdown":
+            logging.info("🛑 Shutting down system via MQTT...")
+            self.respond("shutdown", "Shutting down...")
+            return run_command("sudo shutdown now")
+
+        elif payload == "display":
+            logging.info("📺 Updating display via MQTT...")
+            self.respond("display", "Updating display...")
+            return self.render()
+
+        elif payload == "update_display":
+            logging.info("🔄 Running `run_update_and_display.sh` via MQTT...")
+            self.respond("update_display", "Running update and display script...")
+            return self.run_script(f"bash {SCRIPT_DIR}/run_update_and_display.sh")
+
+        elif payload == "update":
+            logging.info("⬇️ Checking for project updates via MQTT...")
+            self.respond("update", "Checking for updates...")
+            updated = check_for_update(force=True)
+            self.respond("update", "Updated. Restart services to apply." if updated else "No update installed.")
+            return True
+
+        elif payload.startswith("set_image:"):
+            image_name = payload.replace("set_image:", "").strip()
+            image_path = os.path.join(IMAGE_DIR, image_name)
+
+            if os.path.exists(image_path):
+                logging.info(f"🖼️ Setting display to {image_name} via MQTT...")
+                self.respond("set_image", f"Displaying {image_name}")
+                return self.render(image_path)
+
             logging.error(f"❌ Image not found: {image_path}")
-            send_mqtt_response("set_image", f"Error: {image_name} not found.")
+            self.respond("set_image", f"Error: {image_name} not found.")
+            return False
 
-    elif payload.startswith("set_pisugar:"):
-        """Set PiSugar parameters via MQTT, e.g., set_pisugar:battery_output_enabled:true"""
-        try:
-            _, setting, value = payload.split(":")
-            setting = setting.strip()
-            value = value.strip().lower()
-
-            if setting not in PISUGAR_COMMANDS:
-                logging.error(f"❌ Invalid PiSugar setting: {setting}")
-                send_mqtt_response("set_pisugar", f"Error: Invalid setting {setting}")
-                return
-
-            # Convert value for PiSugar compatibility
-            if value in ["true", "on", "enable", "enabled"]:
-                value = "true"
-            elif value in ["false", "off", "disable", "disabled"]:
-                value = "false"
-
-            command = f"echo 'set_{setting} {value}' | nc -q 0 127.0.0.1 8423"
-            logging.info(f"🔧 Setting PiSugar {setting} → {value} via MQTT...")
-            send_mqtt_response(f"set_pisugar_{setting}", f"Setting {setting} → {value}")
-            run_command(command)
+        elif payload.startswith("set_pisugar:"):
+            # Set PiSugar parameters via MQTT, e.g., set_pisugar:battery_output:true
+            try:
+                setting, value = parse_pisugar_setting(payload)
+            except ValueError as e:
+                logging.error(f"❌ {e}")
+                self.respond("set_pisugar", f"Error: {e}")
+                return False
 
-        except ValueError:
-            logging.error(f"❌ Invalid set_pisugar command format: {payload}")
-            send_mqtt_response("set_pisugar", "Error: Invalid command format.")
+            logging.info(f"🔧 Setting PiSugar {setting} → {value} via MQTT...")
+            self.respond(f"set_pisugar_{setting}", f"Setting {setting} → {value}")
+            response = self.pisugar_command(f"set_{setting} {value}")
+            logging.info(f"🔋 PiSugar replied: {response}")
+            return response is not None and "Invalid request" not in response
 
-    else:
         logging.warning(f"⚠️ Unknown command received: {payload}")
-        send_mqtt_response("unknown", "Error: Unknown command.")
+        self.respond("unknown", "Error: Unknown command.")
+        return False
+
+handle_command = CommandHandler().handle
 
 def mqtt_listen():
-    """Listen for MQTT commands (shutdown, display, set_image, update_display, set_pisugar)."""
-    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    """Listen for MQTT commands (shutdown, display, set_image, update_display, update, set_pisugar)."""
+    global mqtt_client
+    client = mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
 
     if MQTT_USERNAME and MQTT_PASSWORD:
         client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
 
     client.on_message = on_message
 
+    # Commands run here, so a 30s panel refresh never stalls keepalives in the network loop
+    threading.Thread(target=command_worker, args=(client,), name="command-worker", daemon=True).start()
+
     while True:
         try:
             client.connect(MQTT_BROKER, MQTT_PORT, 60)
@@ -1,10 +1,17 @@
 #!/usr/bin/env python3
 import os
+import sys
 import json
+import time
+import hashlib
 import logging
-import subprocess
+import threading
 import paho.mqtt.client as mqtt
 from dotenv import load_dotenv
+from state_store import load_json_state, save_json_state
+from pisugar import PiSugarClient
+import timing
+import energy
 
 # ✅ Load environment variables
 load_dotenv()
@@ -20,8 +27,17 @@ MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
 MQTT_USERNAME = os.getenv("MQTT_USERNAME", None)
 MQTT_PASSWORD = os.getenv("MQTT_PASSWORD", None)
 MQTT_TOPIC_PREFIX = os.getenv("MQTT_TOPIC_PREFIX", "epaper_frame")
+MQTT_QOS = int(os.getenv("MQTT_QOS", 1))
 LOG_FILE = os.getenv("LOG_FILE", "/mnt/photos/epaper_logs.txt")
 
+# Seconds to wait for the broker's CONNACK and for all acknowledgements of a batch
+PUBLISH_TIMEOUT = 10
+
+# ✅ Hashes of the discovery configs already on the broker, so unchanged ones aren't resent every wake
+CACHE_DIR = os.getenv("CACHE_DIR", "/mnt/photos/.epaper_cache")
+DISCOVERY_STATE_FILE = os.path.join(CACHE_DIR, "mqtt_discovery.json")
+DISCOVERY_REFRESH = float(os.getenv("MQTT_DISCOVERY_REFRESH_HOURS", 24)) * 60 * 60
+
 # ✅ Human-readable mapping for PiSugar keys
 SENSOR_LABELS = {
     "firmware_version": "Firmware Version",
@@ -47,87 +63,213 @@ SENSOR_LABELS = {
     "temperature": "Device Temperature (°C)",
 }
 
-def run_command(command):
-    """Helper function to execute shell commands and get output."""
+@timing.timed("pisugar_read")
+def get_pisugar_status():
+    """Retrieve all PiSugar-related metrics over one pipelined connection to pisugar-server."""
     try:
-        result = subprocess.run(command, capture_output=True, text=True, shell=True)
-        return result.stdout.strip() if result.stdout else None
-    except Exception as e:
-        logging.error(f"❌ Failed to run command {command}: {e}")
-        return None
-
-def parse_pisugar_response(response):
-    """Extracts only the value from the PiSugar response."""
-    if not response or "Invalid request" in response:
-        return "Unknown"
-    
-    parts = response.split(": ", 1)  # Split only at the first occurrence
-    if len(parts) == 2:
-        return parts[1].strip()
-    return response.strip()
+        with PiSugarClient() as pisugar:
+            return pisugar.get_many(SENSOR_LABELS.keys())
+    except OSError as e:
+        logging.error(f"❌ Failed to query PiSugar: {e}")
+        return {key: "Unknown" for key in SENSOR_LABELS}
 
-def get_pisugar_status():
-    """Retrieve all PiSugar-related metrics and properly format responses."""
-    commands = {key: f"get {key}" for key in SENSOR_LABELS.keys()}
+def discovery_message(topic, payload):
+    """Build the Home Assistant discovery topic and payload for a sensor."""
+    full_topic = f"{MQTT_TOPIC_PREFIX}/{topic}"
+    discovery_topic = f"homeassistant/sensor/{MQTT_TOPIC_PREFIX}_{topic}/config"
 
-    status = {}
-    for key, command in commands.items():
-        response = run_command(f"echo '{command}' | nc -q 0 127.0.0.1 8423")
-        status[key] = parse_pisugar_response(response)
+    # ✅ Determine sensor type (binary_sensor or sensor)
+    sensor_type = "sensor"
+    if payload in ["true", "false"]:  # Convert true/false to binary_sensor
+        sensor_type = "binary_sensor"
 
-    return status
+    # ✅ Use human-readable names for Home Assistant
+    sensor_name = SENSOR_LABELS.get(topic, topic.replace("_", " ").title())
 
-def publish_mqtt(topic, payload, retain=True):
-    """Send MQTT message to Home Assistant using discovery format."""
-    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    discovery_payload = {
+        "name": f"{sensor_name}",
+        "state_topic": full_topic,
+        "unique_id": f"{MQTT_TOPIC_PREFIX}_{topic}",
+        "device": {
+            "identifiers": [MQTT_TOPIC_PREFIX],
+            "name": "PiSugar ePaper Frame",
+            "model": "Raspberry Pi ePaper Frame",
+            "manufacturer": "Mscrnt LLC",
+        },
+    }
 
-    if MQTT_USERNAME and MQTT_PASSWORD:
-        client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+    if topic.startswith("timing_"):
+        discovery_payload["unit_of_measurement"] = "s"
+    elif topic.startswith("energy_"):
+        discovery_payload["unit_of_measurement"] = "mWh"
 
-    try:
-        client.connect(MQTT_BROKER, MQTT_PORT, 60)
+    if sensor_type == "binary_sensor":
+        discovery_payload["payload_on"] = "true"
+        discovery_payload["payload_off"] = "false"
+
+    return discovery_topic, discovery_payload
+
+# A persistent connection registered by a long-running process (see epaper_agent.py)
+_shared_client = None
+
+def set_shared_client(client):
+    """Make every MQTTPublisher in this process (including `publish_mqtt`) reuse `client` instead of connecting."""
+    global _shared_client
+    _shared_client = client
+
+class MQTTPublisher:
+    """One MQTT connection for a whole batch of messages.
+
+    Messages are pipelined without waiting on each other; acknowledgements (PUBACK for QoS 1)
+    are collected once in `flush()`, just before the single disconnect. With `discovery_cache=False`
+    every discovery config is sent, and nothing is recorded about it.
+    """
+
+    def __init__(self, qos=MQTT_QOS, client=None, discovery_cache=True):
+        self.qos = qos
+        self.pending = []
+        self.discovery_cache = discovery_cache
+        self.discovery_state = load_json_state(DISCOVERY_STATE_FILE, {}) if discovery_cache else {}
+        self.discovery_sent = {}
+        self.discovery_skipped = 0
+
+        # Borrow a long-lived process's connection if it registered one; otherwise open a private one
+        self.client = client or _shared_client
+        self.owns_client = self.client is None
+        if self.owns_client:
+            self.connected = threading.Event()
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+            if MQTT_USERNAME and MQTT_PASSWORD:
+                self.client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+            self.client.on_connect = lambda client, userdata, flags, reason_code, properties: self.connected.set()
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        if not self.owns_client:
+            if not self.client.is_connected():
+                raise ConnectionError("Shared MQTT connection is down")
+            return self
+
+        self.client.connect(MQTT_BROKER, MQTT_PORT, 60)
+        self.client.loop_start()
+        if not self.connected.wait(PUBLISH_TIMEOUT):
+            self.client.loop_stop()
+            raise ConnectionError(f"No CONNACK from {MQTT_BROKER}:{MQTT_PORT}")
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        started_at = time.time() - (time.monotonic() - self.started)
+        try:
+            self.flush()
+        finally:
+            if self.owns_client:
+                self.client.disconnect()
+                self.client.loop_stop()
+            timing.record("mqtt_publish", started_at, time.monotonic() - self.started)
+        if self.owns_client:
+            logging.info(f"📡 MQTT session closed after {time.monotonic() - self.started:.2f}s")
 
+    def publish(self, topic, payload, retain=False):
+        """Queue a message on the open connection without waiting for it to be acknowledged."""
+        self.pending.append((topic, self.client.publish(topic, payload, qos=self.qos, retain=retain)))
+
+    def publish_sensor(self, topic, payload, retain=True):
+        """Publish a sensor's state, plus its Home Assistant discovery config if that is new or changed."""
+        discovery_topic, discovery_payload = discovery_message(topic, payload)
         full_topic = f"{MQTT_TOPIC_PREFIX}/{topic}"
-        discovery_topic = f"homeassistant/sensor/{MQTT_TOPIC_PREFIX}_{topic}/config"
-
-        # ✅ Determine sensor type (binary_sensor or sensor)
-        sensor_type = "sensor"
-        if payload in ["true", "false"]:  # Convert true/false to binary_sensor
-            sensor_type = "binary_sensor"
-
-        # ✅ Use human-readable names for Home Assistant
-        sensor_name = SENSOR_LABELS.get(topic, topic.replace("_", " ").title())
-
-        # ✅ Publish Discovery message
-        discovery_payload = {
-            "name": f"{sensor_name}",
-            "state_topic": full_topic,
-            "unique_id": f"{MQTT_TOPIC_PREFIX}_{topic}",
-            "device": {
-                "identifiers": [MQTT_TOPIC_PREFIX],
-                "name": "PiSugar ePaper Frame",
-                "model": "Raspberry Pi ePaper Frame",
-                "manufacturer": "Mscrnt LLC",
-            },
-        }
-
-        if sensor_type == "binary_sensor":
-            discovery_payload["payload_on"] = "true"
-            discovery_payload["payload_off"] = "false"
-
-        client.publish(discovery_topic, json.dumps(discovery_payload), retain=True)
-        client.publish(full_topic, json.dumps(payload), retain=retain)
 
+        # Discovery configs are retained by the broker, so resend one only when it changed (or is getting old)
+        discovery_body = json.dumps(discovery_payload, sort_keys=True)
+        digest = hashlib.sha1(discovery_body.encode("utf-8")).hexdigest()
+        known = self.discovery_state.get(discovery_topic)
+        if known and known["digest"] == digest and time.time() - known["sent_at"] < DISCOVERY_REFRESH:
+            self.discovery_skipped += 1
+        else:
+            self.publish(discovery_topic, discovery_body, retain=True)
+            self.discovery_sent[discovery_topic] = {"digest": digest, "sent_at": time.time()}
+
+        self.publish(full_topic, json.dumps(payload), retain=retain)
         logging.info(f"✅ Sent MQTT update to {full_topic}: {payload}")
-        client.disconnect()
+
+    def flush(self, timeout=PUBLISH_TIMEOUT):
+        """Wait until every queued message is acknowledged (QoS 1/2) or written to the socket (QoS 0)."""
+        deadline = time.monotonic() + timeout
+        unacked = []
+        for topic, info in self.pending:
+            try:
+                info.wait_for_publish(max(0, deadline - time.monotonic()))
+            except (RuntimeError, ValueError) as e:
+                logging.error(f"❌ MQTT publish to {topic} failed: {e}")
+            if not info.is_published():
+                unacked.append(topic)
+
+        if unacked:
+            logging.error(f"❌ {len(unacked)} of {len(self.pending)} MQTT messages were not acknowledged: {unacked}")
+        else:
+            logging.info(f"📨 {len(self.pending)} MQTT messages acknowledged (QoS {self.qos})")
+        if self.discovery_skipped:
+            logging.info(f"🔕 Skipped {self.discovery_skipped} unchanged discovery configs")
+
+        # Only remember discovery configs the broker actually acknowledged
+        delivered = {topic: sent for topic, sent in self.discovery_sent.items() if topic not in unacked}
+        if delivered and self.discovery_cache:
+            self.discovery_state.update(delivered)
+            try:
+                save_json_state(DISCOVERY_STATE_FILE, self.discovery_state)
+            except OSError as e:
+                logging.error(f"❌ Failed to save MQTT discovery state: {e}")
+
+        self.pending = []
+        self.discovery_sent = {}
+        self.discovery_skipped = 0
+        return not unacked
+
+def publish_mqtt(topic, payload, retain=True):
+    """Send a single MQTT message to Home Assistant using discovery format (one connection per call)."""
+    try:
+        with MQTTPublisher() as publisher:
+            publisher.publish_sensor(topic, payload, retain=retain)
     except Exception as e:
         logging.error(f"❌ Failed to send MQTT message: {e}")
 
+def publish_status(status):
+    """Publish every PiSugar metric over one shared MQTT connection."""
+    try:
+        with MQTTPublisher() as publisher:
+            for key, value in status.items():
+                publisher.publish_sensor(key, value)
+    except Exception as e:
+        logging.error(f"❌ Failed to send MQTT messages: {e}")
+
+def benchmark_publish(status):
+    """Compare one connection per sensor (the old behaviour) with one shared connection.
+
+    Both runs send every discovery config: with the cache, whichever run went second would skip them all.
+    """
+    started = time.monotonic()
+    for key, value in status.items():
+        with MQTTPublisher(discovery_cache=False) as publisher:
+            publisher.publish_sensor(key, value)
+    per_message = time.monotonic() - started
+
+    started = time.monotonic()
+    with MQTTPublisher(discovery_cache=False) as publisher:
+        for key, value in status.items():
+            publisher.publish_sensor(key, value)
+    shared = time.monotonic() - started
+
+    logging.info(
+        f"⏱ {len(status)} sensors ({2 * len(status)} messages each way): {per_message:.2f}s with a connection each, "
+        f"{shared:.2f}s with one shared connection ({per_message - shared:.2f}s saved)"
+    )
+
 
 if __name__ == "__main__":
     # ✅ Retrieve values automatically
     pisugar_status = get_pisugar_status()
 
-    # ✅ Send each PiSugar metric separately
-    for key, value in pisugar_status.items():
-        publish_mqtt(key, value)
+    if "--benchmark" in sys.argv:
+        benchmark_publish(pisugar_status)
+    else:
+        # ✅ Send all PiSugar metrics, and where this wake's time and energy went, over a single connection
+        publish_status({**pisugar_status, **timing.timing_sensors(), **energy.energy_sensors()})
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import logging
+import subprocess
+from state_store import load_json_state, save_json_state
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+
+# ✅ Over-the-air updates: how often to look for new commits, and which branch to follow
+OTA_CHECK_INTERVAL = float(os.getenv("OTA_CHECK_HOURS", 24)) * 60 * 60
+OTA_BRANCH = os.getenv("OTA_BRANCH", "main")
+GIT_TIMEOUT = 30  # seconds per git command, so a bad network can't hold the wake open
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.getenv("CACHE_DIR", "/mnt/photos/.epaper_cache")
+OTA_STATE_FILE = os.path.join(CACHE_DIR, "ota_update.json")
+
+
+def git(*args):
+    """Run a git command in the project directory and return its stripped stdout. Raises on failure."""
+    result = subprocess.run(
+        ["git", "-c", f"safe.directory={PROJECT_DIR}", *args],
+        cwd=PROJECT_DIR, capture_output=True, text=True, timeout=GIT_TIMEOUT, check=True
+    )
+    return result.stdout.strip()
+
+
+def update_due(state):
+    return time.time() - state.get("last_check", 0) >= OTA_CHECK_INTERVAL
+
+
+def check_for_update(force=False):
+    """Update the project from origin if the remote branch moved.
+
+    Runs at most every OTA_CHECK_HOURS unless `force`d (e.g. by the MQTT "update" command).
+    The remote ref is compared with HEAD first (one small round trip), so nothing is fetched
+    or written when the frame is already current. Returns True if new code was installed.
+    """
+    state = load_json_state(OTA_STATE_FILE, {})
+    if not force and not update_due(state):
+        logging.info("⏭ OTA update not due yet.")
+        return False
+
+    try:
+        remote = git("ls-remote", "origin", f"refs/heads/{OTA_BRANCH}").split()
+        if not remote:
+            logging.error(f"❌ Branch {OTA_BRANCH} not found on origin.")
+            return False
+        remote_sha, local_sha = remote[0], git("rev-parse", "HEAD")
+
+        updated = False
+        if remote_sha == local_sha:
+            logging.info(f"✅ Already up to date ({local_sha[:7]}).")
+        else:
+            logging.info(f"🔄 Updating {local_sha[:7]} → {remote_sha[:7]}...")
+            git("fetch", "origin", OTA_BRANCH)
+            git("reset", "--hard", "FETCH_HEAD")  # Ensure a clean update
+            logging.info("✅ Update complete! New code runs from the next wake.")
+            updated = True
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+        stderr = getattr(e, "stderr", None)
+        logging.error(f"❌ OTA update failed: {(stderr or str(e)).strip()}")
+        return False
+
+    # Only a successful check resets the interval, so an offline wake retries next time
+    save_json_state(OTA_STATE_FILE, {"last_check": time.time(), "commit": remote_sha})
+    return updated
+
+
+if __name__ == "__main__":
+    check_for_update(force="--force" in sys.argv)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import shutil
+import socket
+import logging
+import subprocess
+from datetime import datetime, timedelta
+
+# ✅ PiSugar power manager server (pisugar-server) TCP endpoint
+PISUGAR_HOST = os.getenv("PISUGAR_HOST", "127.0.0.1")
+PISUGAR_PORT = int(os.getenv("PISUGAR_PORT", 8423))
+PISUGAR_TIMEOUT = 3  # seconds to wait for outstanding responses
+
+# Weekday bitmask for the RTC alarm: 127 = every day
+ALARM_EVERY_DAY = 127
+
+
+def parse_pisugar_response(response):
+    """Extracts only the value from the PiSugar response."""
+    if not response or "Invalid request" in response:
+        return "Unknown"
+
+    parts = response.split(": ", 1)  # Split only at the first occurrence
+    if len(parts) == 2:
+        return parts[1].strip()
+    return response.strip()
+
+
+class PiSugarClient:
+    """Talks to pisugar-server over one TCP connection.
+
+    Requests are pipelined: all of them are written at once and the responses are
+    matched up as they stream back, instead of one shell + nc process per request.
+    """
+
+    def __init__(self, host=PISUGAR_HOST, port=PISUGAR_PORT, timeout=PISUGAR_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.buffer = b""
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def connect(self):
+        if self.sock is None:
+            self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # Requests are tiny; don't let Nagle hold them
+        return self
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _read_line(self, deadline):
+        """Return the next response line, or None once the deadline passes.
+
+        Raises ConnectionResetError if the server hung up.
+        """
+        while b"\n" not in self.buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self.sock.settimeout(remaining)
+            try:
+                chunk = self.sock.recv(4096)
+            except socket.timeout:
+                return None
+            if not chunk:
+                raise ConnectionResetError("pisugar-server closed the connection")
+            self.buffer += chunk
+
+        line, self.buffer = self.buffer.split(b"\n", 1)
+        return line.decode("utf-8", errors="replace").rstrip("\r")
+
+    def request_many(self, commands):
+        """Send every command in one write and return their raw responses, in command order.
+
+        A response is matched to its command by its "name: " prefix; lines without one
+        (e.g. "Invalid request.") go to the oldest unanswered command. Unanswered commands get None.
+        If the connection turns out to be dead (pisugar-server restarted), the unanswered commands
+        are sent once more over a fresh one.
+        """
+        responses = [None] * len(commands)
+        outstanding = list(range(len(commands)))
+        names = [command.split()[-1] if command.startswith("get ") else command.split()[0] for command in commands]
+
+        self.connect()
+        try:
+            self._exchange(commands, names, responses, outstanding)
+        except OSError as e:
+            logging.warning(f"🔌 PiSugar connection lost ({e}); reconnecting")
+            self.close()
+            self.connect()
+            try:
+                self._exchange(commands, names, responses, outstanding)
+            except OSError:
+                self.close()
+                raise
+
+        if outstanding:
+            logging.warning(f"⚠ PiSugar didn't answer {len(outstanding)} of {len(commands)} requests")
+        return responses
+
+    def _exchange(self, commands, names, responses, outstanding):
+        """Write the outstanding commands and fill in `responses` as their answers arrive."""
+        self.buffer = b""
+        self.sock.sendall("".join(f"{commands[i]}\n" for i in outstanding).encode("utf-8"))
+        deadline = time.monotonic() + self.timeout
+
+        while outstanding:
+            line = self._read_line(deadline)
+            if line is None:
+                break
+            if not line.strip():
+                continue
+
+            prefix = line.split(":", 1)[0].strip()
+            index = next((i for i in outstanding if names[i] == prefix), outstanding[0])
+            responses[index] = line
+            outstanding.remove(index)
+
+    def get_many(self, keys):
+        """Fetch several PiSugar values at once, e.g. {"battery": "85.2", ...}."""
+        keys = list(keys)
+        responses = self.request_many([f"get {key}" for key in keys])
+        return {key: parse_pisugar_response(response) for key, response in zip(keys, responses)}
+
+    def command(self, command):
+        """Send a single command (e.g. "rtc_web" or "set_anti_mistouch true") and return its response."""
+        return self.request_many([command])[0]
+
+
+def set_wake_alarm(offset_minutes):
+    """Sync the RTC with web time, then set the RTC wake alarm `offset_minutes` from now."""
+    with PiSugarClient() as pisugar:
+        logging.info("⏳ Syncing RTC with web time...")
+        pisugar.command("rtc_web")
+
+        # Give the sync a moment to settle before reading the clock
+        time.sleep(2)
+
+        wake_time = (datetime.now().astimezone() + timedelta(minutes=offset_minutes)).isoformat(timespec="seconds")
+        logging.info(f"⏰ Setting RTC wakeup alarm to: {wake_time}")
+        response = pisugar.command(f"rtc_alarm_set {wake_time} {ALARM_EVERY_DAY}")
+        logging.info(f"✅ RTC wakeup alarm set: {response}")
+        return response
+
+
+def benchmark(keys):
+    """Compare one shell + nc process per key (the old way) with one pipelined connection."""
+    if not shutil.which("nc"):
+        logging.warning("⚠ nc is not installed; the shelled-out timing only measures shell startup")
+
+    started = time.monotonic()
+    for key in keys:
+        subprocess.run(
+            f"echo 'get {key}' | nc -q 0 {PISUGAR_HOST} {PISUGAR_PORT}",
+            shell=True, capture_output=True, text=True
+        )
+    shelled = time.monotonic() - started
+
+    started = time.monotonic()
+    with PiSugarClient() as pisugar:
+        pisugar.get_many(keys)
+    pipelined = time.monotonic() - started
+
+    logging.info(f"⏱ {len(keys)} keys: {shelled:.3f}s via nc, {pipelined:.3f}s pipelined")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    if len(sys.argv) >= 3 and sys.argv[1] == "wake":
+        set_wake_alarm(int(sys.argv[2]))
+    elif len(sys.argv) >= 2 and sys.argv[1] == "--benchmark":
+        from mqtt_update import SENSOR_LABELS
+        benchmark(list(SENSOR_LABELS))
+    elif len(sys.argv) >= 2:
+        with PiSugarClient() as pisugar:
+            print(pisugar.command(" ".join(sys.argv[1:])))
+    else:
+        print("Usage: pisugar.py wake <minutes> | --benchmark | <raw command>")
+        sys.exit(1)
@@ -0,0 +1,39 @@
+import os
+import json
+import logging
+import tempfile
+
+
+def load_json_state(path, default=None):
+    """Load a JSON state file, returning `default` if it is missing or unreadable."""
+    try:
+        with open(path, "r") as state_file:
+            return json.load(state_file)
+    except FileNotFoundError:
+        return default
+    except (OSError, ValueError) as e:
+        logging.warning(f"⚠ Ignoring unreadable state file {path}: {e}")
+        return default
+
+
+def save_json_state(path, data):
+    """Atomically write a JSON state file so a power cut never leaves it half-written."""
+    atomic_write_bytes(path, json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+
+def atomic_write_bytes(path, data):
+    """Write a file via temp file + fsync + rename: readers see either the old or the new contents, never a mix."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
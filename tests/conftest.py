@@ -0,0 +1,28 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# config.py and timing.py read these at import time: keep state out of /mnt/photos and use no service account
+os.environ["CACHE_DIR"] = tempfile.mkdtemp(prefix="epaper_tests_")
+os.environ["GOOGLE_SERVICE_ACCOUNT"] = ""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "utilities"))
+
+
+@pytest.fixture
+def fake_drive(monkeypatch):
+    """A FakeDrive server, with the Drive session pointed at it (see tests/fake_drive.py)."""
+    import drive_session
+    from config import CONFIG
+    from fake_drive import FakeDrive
+
+    drive = FakeDrive()
+    monkeypatch.setitem(CONFIG, "DRIVE_API_ENDPOINT", drive.url)
+    monkeypatch.setitem(CONFIG, "SERVICE_ACCOUNT_FILE", "")
+    monkeypatch.setattr(drive_session, "_session", None)
+    yield drive
+    drive.close()
@@ -0,0 +1,167 @@
+import re
+import json
+import random
+import hashlib
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeDrive:
+    """Just enough of the Drive v3 API over local HTTP for DRIVE_API_ENDPOINT.
+
+    files.list and changes.list page at most `page_limit` entries, so a few files already span several
+    pages. Media downloads honour Range. `fail_rate` makes that share of media requests fail (HTTP 503,
+    a dropped connection or a short body, drawn from a seeded RNG), and `fail_after_bytes` fails every
+    media request once that many bytes have been served, like a link that went away mid-download.
+    """
+
+    def __init__(self, page_limit=2, seed=0):
+        self.page_limit = page_limit
+        self.files = {}
+        self.media = {}
+        self.changes = []  # A page token is an index into this list
+        self.fail_rate = 0.0
+        self.fail_after_bytes = None
+        self.served_bytes = 0
+        self.requests = []  # (path, query, Range header)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_file(self, file_id, name, data=b"", parents=("folder",), mime_type="image/png"):
+        resource = {
+            "id": file_id,
+            "name": name,
+            "mimeType": mime_type,
+            "md5Checksum": hashlib.md5(data).hexdigest(),
+            "size": str(len(data)),
+            "modifiedTime": "2026-01-01T00:00:00.000Z",
+            "parents": list(parents),
+            "trashed": False,
+        }
+        self.files[file_id] = resource
+        self.media[file_id] = data
+        self.changes.append({"fileId": file_id, "removed": False, "file": resource})
+        return resource
+
+    def remove_file(self, file_id):
+        del self.files[file_id]
+        del self.media[file_id]
+        self.changes.append({"fileId": file_id, "removed": True})
+
+    def requests_to(self, suffix):
+        return [request for request in self.requests if request[0].endswith(suffix)]
+
+    def _files_page(self, query):
+        folder = re.search(r"'([^']+)' in parents", query.get("q", ""))
+        ids = sorted(
+            file_id for file_id, resource in self.files.items()
+            if not folder or folder.group(1) in resource["parents"]
+        )
+        start = int(query.get("pageToken") or 0)
+        size = min(int(query.get("pageSize", 100)), self.page_limit)
+        page = {"files": [self.files[file_id] for file_id in ids[start:start + size]]}
+        if start + size < len(ids):
+            page["nextPageToken"] = str(start + size)
+        return page
+
+    def _changes_page(self, query):
+        token = query.get("pageToken", "")
+        if not token.isdigit() or int(token) > len(self.changes):
+            return None
+        start = int(token)
+        size = min(int(query.get("pageSize", 100)), self.page_limit)
+        page = {"changes": self.changes[start:start + size]}
+        if start + size < len(self.changes):
+            page["nextPageToken"] = str(start + size)
+        else:
+            page["newStartPageToken"] = str(len(self.changes))
+        return page
+
+    def _media_failure(self):
+        """None, or how this media request should fail."""
+        with self.lock:
+            if self.fail_after_bytes is not None and self.served_bytes >= self.fail_after_bytes:
+                return "status"
+            if self.rng.random() < self.fail_rate:
+                return self.rng.choice(["status", "drop", "short"])
+        return None
+
+    def _handler(self):
+        drive = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def send_body(self, status, body, content_type="application/json", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_json(self, payload, status=200):
+                self.send_body(status, json.dumps(payload).encode("utf-8"))
+
+            def do_GET(self):
+                url = urllib.parse.urlparse(self.path)
+                query = dict(urllib.parse.parse_qsl(url.query))
+                drive.requests.append((url.path, query, self.headers.get("Range")))
+
+                if url.path.endswith("/changes/startPageToken"):
+                    return self.send_json({"startPageToken": str(len(drive.changes))})
+                if url.path.endswith("/changes"):
+                    page = drive._changes_page(query)
+                    if page is None:
+                        return self.send_json({"error": {"code": 400, "message": "Invalid pageToken"}}, 400)
+                    return self.send_json(page)
+                if url.path.endswith("/files"):
+                    return self.send_json(drive._files_page(query))
+
+                match = re.search(r"/files/([^/]+)$", url.path)
+                if not match or match.group(1) not in drive.files:
+                    return self.send_json({"error": {"code": 404, "message": "File not found"}}, 404)
+                file_id = match.group(1)
+                if query.get("alt") != "media":
+                    return self.send_json(drive.files[file_id])
+                self.send_media(drive.media[file_id])
+
+            def send_media(self, data):
+                failure = drive._media_failure()
+                if failure == "status":
+                    return self.send_json({"error": {"code": 503, "message": "Backend Error"}}, 503)
+                if failure == "drop":
+                    self.close_connection = True  # Hang up without answering
+                    return
+
+                byte_range = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range") or "")
+                if not byte_range:
+                    drive.served_bytes += len(data)
+                    return self.send_body(200, data, "application/octet-stream")
+
+                start = int(byte_range.group(1))
+                end = min(int(byte_range.group(2) or len(data) - 1), len(data) - 1)
+                if start >= len(data):
+                    return self.send_body(416, b"", headers={"Content-Range": f"bytes */{len(data)}"})
+                if failure == "short":
+                    end = start + (end - start) // 2  # Part of the range, correctly labelled
+                chunk = data[start:end + 1]
+                drive.served_bytes += len(chunk)
+                self.send_body(206, chunk, "application/octet-stream",
+                               headers={"Content-Range": f"bytes {start}-{end}/{len(data)}"})
+
+        return Handler
@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+import drive_download
+from config import CONFIG
+
+DATA = bytes(range(256)) * 40  # 10 KiB, no two chunks alike
+
+
+@pytest.fixture
+def small_chunks(fake_drive, monkeypatch):
+    """Retry without sleeping and split DATA into many 512-byte range requests."""
+    monkeypatch.setattr(drive_download, "RETRY_BACKOFF", 0)
+    monkeypatch.setitem(CONFIG, "DRIVE_CHUNK_SIZE", 512)
+    monkeypatch.setitem(CONFIG, "DRIVE_DOWNLOAD_WORKERS", 1)
+    fake_drive.add_file("photo", "photo.png", DATA)
+    return fake_drive
+
+
+def media_ranges(drive):
+    return [request[2] for request in drive.requests_to("/files/photo") if request[1].get("alt") == "media"]
+
+
+def test_failed_ranges_are_retried_into_the_right_bytes(small_chunks, tmp_path, monkeypatch):
+    monkeypatch.setattr(drive_download, "MAX_RETRIES", 20)
+    small_chunks.fail_rate = 0.3
+    part_path = tmp_path / "photo.png.part"
+
+    transferred = drive_download.download_media("photo", str(part_path))
+
+    assert part_path.read_bytes() == DATA
+    assert transferred == len(DATA)
+    assert len(media_ranges(small_chunks)) > len(DATA) // 512  # Some ranges really did fail
+
+
+def test_parallel_ranges_survive_failures(small_chunks, tmp_path, monkeypatch):
+    monkeypatch.setattr(drive_download, "MAX_RETRIES", 20)
+    monkeypatch.setattr(drive_download, "PARALLEL_MIN_BYTES", 1)
+    monkeypatch.setitem(CONFIG, "DRIVE_DOWNLOAD_WORKERS", 3)
+    small_chunks.fail_rate = 0.3
+    part_path = tmp_path / "photo.png.part"
+
+    transferred = drive_download.download_media("photo", str(part_path), total_size=len(DATA))
+
+    assert part_path.read_bytes() == DATA
+    assert transferred == len(DATA)
+    assert sorted(os.listdir(tmp_path)) == ["photo.png.part"]  # Segment files stitched and removed
+
+
+def test_interrupted_download_resumes_where_it_stopped(small_chunks, tmp_path, monkeypatch):
+    monkeypatch.setattr(drive_download, "MAX_RETRIES", 2)
+    small_chunks.fail_after_bytes = 3000
+    part_path = tmp_path / "photo.png.part"
+
+    with pytest.raises(Exception):
+        drive_download.download_media("photo", str(part_path))
+    prefix = part_path.read_bytes()
+    assert prefix and len(prefix) < len(DATA)
+    assert DATA.startswith(prefix)
+
+    small_chunks.fail_after_bytes = None
+    small_chunks.requests.clear()
+    transferred = drive_download.download_media("photo", str(part_path))
+
+    assert part_path.read_bytes() == DATA
+    assert transferred == len(DATA) - len(prefix)
+    assert media_ranges(small_chunks)[0].startswith(f"bytes={len(prefix)}-")
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+import drive_manifest
+from drive_session import get_drive_session
+
+
+@pytest.fixture
+def manifest_file(tmp_path, monkeypatch):
+    path = tmp_path / "drive_manifest.json"
+    monkeypatch.setattr(drive_manifest, "MANIFEST_FILE", str(path))
+    return path
+
+
+def test_full_sync_follows_every_page(fake_drive, manifest_file):
+    for index in range(5):
+        fake_drive.add_file(f"id{index}", f"img{index}.png")
+    fake_drive.add_file("elsewhere", "other.png", parents=("another-folder",))
+
+    manifest = drive_manifest.sync_manifest(get_drive_session().service, "folder")
+
+    assert sorted(manifest["files"]) == [f"id{index}" for index in range(5)]
+    assert len(fake_drive.requests_to("/files")) == 3  # 2 + 2 + 1 with page_limit=2
+    assert manifest["start_page_token"] == str(len(fake_drive.changes))
+    assert json.loads(manifest_file.read_text())["files"] == manifest["files"]
+
+
+def test_later_syncs_replay_the_changes_feed(fake_drive, manifest_file):
+    for index in range(3):
+        fake_drive.add_file(f"id{index}", f"img{index}.png")
+    service = get_drive_session().service
+    drive_manifest.sync_manifest(service, "folder")
+    listed = len(fake_drive.requests_to("/files"))
+
+    # Three changes: more than one page of the feed
+    fake_drive.add_file("new", "new.png")
+    fake_drive.remove_file("id0")
+    fake_drive.add_file("elsewhere", "other.png", parents=("another-folder",))
+    manifest = drive_manifest.sync_manifest(service, "folder")
+
+    assert sorted(manifest["files"]) == ["id1", "id2", "new"]
+    assert manifest["files"]["new"]["name"] == "new.png"
+    assert len(fake_drive.requests_to("/files")) == listed  # No re-listing
+    assert len(fake_drive.requests_to("/changes")) == 2
+    assert manifest["start_page_token"] == str(len(fake_drive.changes))
+
+    # Nothing new: one request, same manifest
+    again = drive_manifest.sync_manifest(service, "folder")
+    assert again["files"] == manifest["files"]
+    assert len(fake_drive.requests_to("/changes")) == 3
+
+
+def test_rejected_token_falls_back_to_a_full_sync(fake_drive, manifest_file):
+    fake_drive.add_file("id0", "img0.png")
+    service = get_drive_session().service
+    manifest = drive_manifest.sync_manifest(service, "folder")
+    manifest["start_page_token"] = "expired"
+    manifest_file.write_text(json.dumps(manifest))
+
+    fake_drive.add_file("id1", "img1.png")
+    manifest = drive_manifest.sync_manifest(service, "folder")
+
+    assert sorted(manifest["files"]) == ["id0", "id1"]
+    assert manifest["start_page_token"] == str(len(fake_drive.changes))
@@ -0,0 +1,105 @@
+import os
+import logging
+import subprocess
+import sys
+
+import pytest
+
+import image_scheduler
+from config import CONFIG
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def describe(key):
+    return key, 0  # Named after its key, added long ago
+
+
+def pick(keys, source="local"):
+    key, commit = image_scheduler.reserve_next(source, keys, describe)
+    commit()
+    return key
+
+
+def library(count, prefix="img"):
+    return [f"{prefix}{index:03d}.png" for index in range(count)]
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch, caplog):
+    caplog.set_level(logging.INFO)
+    monkeypatch.setitem(CONFIG, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setitem(CONFIG, "FAVORITES_FILE", str(tmp_path / "favorites.txt"))
+    return tmp_path
+
+
+def test_a_pass_shows_every_image_once(caplog):
+    keys = library(30)
+
+    shown = [pick(keys) for _ in keys]
+
+    assert sorted(shown) == keys
+    assert "Dealing the first local deck of 30 images" in caplog.text
+    assert "library changed" not in caplog.text
+
+
+def test_library_changes_are_merged_into_the_pass(caplog):
+    keys = library(20)
+    shown = [pick(keys) for _ in range(8)]
+    unshown = [key for key in keys if key not in shown]
+
+    removed = [shown[0]] + unshown[:2]
+    added = library(3, prefix="new")
+    changed = [key for key in keys if key not in removed] + added
+    rest = [pick(changed) for _ in range(len(unshown) - 2 + len(added))]
+
+    # The pass carries on: no image shown earlier comes back, removed ones never appear, new ones do
+    assert sorted(rest) == sorted(unshown[2:] + added)
+    assert f"{len(rest)} images left this pass (3 new)" in caplog.text
+    # Only once the whole library has been shown does a new pass start
+    assert pick(changed) in changed
+    assert "Every local image has been shown" in caplog.text
+
+
+def test_recently_shown_images_are_held_back(monkeypatch):
+    monkeypatch.setattr(image_scheduler, "PICK_WINDOW", 1)  # Picks follow the deck order exactly
+    keys = library(20)
+
+    first_pass = [pick(keys) for _ in keys]
+    second_pass = [pick(keys) for _ in keys]
+
+    assert sorted(second_pass) == keys
+    # The last half of one pass goes to the back of the next, in the order it was shown
+    assert second_pass[10:] == first_pass[10:]
+    assert not set(second_pass[:10]) & set(first_pass[10:])
+
+
+def test_an_uncommitted_pick_does_not_advance_the_deck(monkeypatch):
+    monkeypatch.setattr(image_scheduler, "PICK_WINDOW", 1)
+    keys = library(10)
+    pick(keys)
+
+    reserved, _ = image_scheduler.reserve_next("local", keys, describe)
+
+    assert pick(keys) == reserved
+
+
+def test_the_deck_survives_a_restart(cache_dir):
+    keys = library(12)
+    before = [pick(keys) for _ in range(5)]
+
+    # A fresh interpreter, as after power-off, picks up where this one stopped
+    script = (
+        "import sys, image_scheduler\n"
+        "keys = sys.argv[1:]\n"
+        "for _ in range(len(keys) - 5):\n"
+        "    key, commit = image_scheduler.reserve_next('local', keys, lambda key: (key, 0))\n"
+        "    commit()\n"
+        "    print(key)\n"
+    )
+    env = dict(os.environ, CACHE_DIR=str(cache_dir), FAVORITES_FILE=str(cache_dir / "favorites.txt"))
+    result = subprocess.run([sys.executable, "-c", script, *keys], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    after = result.stdout.split()
+
+    assert sorted(before + after) == keys
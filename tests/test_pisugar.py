@@ -0,0 +1,57 @@
+import socket
+import threading
+
+import pytest
+
+from fake_pisugar_server import PiSugarHandler, PiSugarServer
+from pisugar import PiSugarClient
+
+
+class TrackingHandler(PiSugarHandler):
+    """Remembers every server-side connection so a test can cut them, like pisugar-server restarting."""
+
+    connections = []
+
+    def setup(self):
+        super().setup()
+        self.connections.append(self.connection)
+
+
+@pytest.fixture
+def server():
+    TrackingHandler.connections = []
+    server = PiSugarServer(("127.0.0.1", 0), TrackingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def client_for(server):
+    return PiSugarClient(*server.server_address, timeout=2)
+
+
+def test_pipelined_batch_keeps_command_order(server):
+    with client_for(server) as pisugar:
+        responses = pisugar.request_many([
+            "get battery", "get nonsense", "set_anti_mistouch true", "get model", "get battery_v",
+        ])
+        values = pisugar.get_many(["battery_i", "model", "nonsense"])
+
+    assert responses == [
+        "battery: 87.5", "Invalid request.", "set_anti_mistouch: done", "model: PiSugar 3", "battery_v: 4.05",
+    ]
+    assert values == {"battery_i": "0.21", "model": "PiSugar 3", "nonsense": "Unknown"}
+    assert len(TrackingHandler.connections) == 1  # Both batches shared one connection
+
+
+def test_dropped_connection_is_reopened(server):
+    with client_for(server) as pisugar:
+        assert pisugar.get_many(["battery"]) == {"battery": "87.5"}
+
+        for connection in TrackingHandler.connections:
+            connection.shutdown(socket.SHUT_RDWR)
+
+        assert pisugar.get_many(["battery", "model"]) == {"battery": "87.5", "model": "PiSugar 3"}
+
+    assert len(TrackingHandler.connections) == 2
@@ -0,0 +1,98 @@
+import pytest
+from PIL import Image, ImageDraw
+
+from epd_emulator import spi_backend
+from epd_emulator.refresh_timing import load_refresh_timing
+
+
+def half_black(epd):
+    """Left half black, right half white."""
+    image = Image.new("1", (epd.width, epd.height), 1)
+    ImageDraw.Draw(image).rectangle((0, 0, epd.width // 2 - 1, epd.height - 1), fill=0)
+    return image
+
+
+@pytest.mark.parametrize("model, display_partial", [
+    ("epd2in13_V3", "displayPartial"),
+    ("epd2in9_V2", "display_Partial"),
+])
+def test_lut_drivers_full_refresh_is_full(model, display_partial):
+    # These drivers load their own waveform over 0x32, so their full refresh sends 0x22 0xC7 (no LUT load bits)
+    epd, emulator = spi_backend.install(model)
+    timing = load_refresh_timing(model)
+    image = epd.getbuffer(half_black(epd))
+
+    epd.init()
+    epd.display(image)
+    getattr(epd, display_partial)(image)
+
+    assert [(mode, seconds) for mode, seconds, _ in emulator.frames] == [
+        ("full", timing["full"]), ("partial", timing["partial"]),
+    ]
+    assert emulator.clock.skipped >= timing["full"] + timing["partial"]
+    assert emulator.frames[0][2].getpixel((0, 0)) == (0, 0, 0)
+    assert emulator.frames[0][2].getpixel((epd.width - 1, 0)) == (255, 255, 255)
+
+
+def test_fast_option_without_lut_load_is_still_fast():
+    epd, emulator = spi_backend.install("epd2in13_V4")
+
+    epd.init_fast()
+    epd.display_fast(epd.getbuffer(half_black(epd)))
+
+    assert emulator.frames[-1][:2] == ("fast", load_refresh_timing("epd2in13_V4")["fast"])
+
+
+def three_bands(epd):
+    """Black, red and white thirds, left to right."""
+    image = Image.new("RGB", (epd.width, epd.height), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, epd.width // 3, epd.height), fill=(0, 0, 0))
+    draw.rectangle((epd.width // 3, 0, 2 * epd.width // 3, epd.height), fill=(255, 0, 0))
+    return image
+
+
+def run_driver(model):
+    epd, emulator = spi_backend.install(model)
+    epd.init()
+    spi_backend.show(epd, emulator, three_bands(epd))
+    epd.sleep()
+    return epd, emulator
+
+
+@pytest.mark.parametrize("model", sorted(spi_backend.PROFILES))
+def test_every_profiled_driver_produces_a_frame(model):
+    epd, emulator = run_driver(model)
+
+    assert len(emulator.frames) == 1
+    frame = emulator.frames[0][2]
+    assert frame.size == (epd.width, epd.height)
+    assert frame.getpixel((1, epd.height // 2)) == (0, 0, 0)
+    assert frame.getpixel((epd.width - 2, epd.height // 2)) == (255, 255, 255)
+
+
+@pytest.mark.parametrize("model, family, color", [
+    ("epd2in7_V2", 0x20, False),
+    ("epd2in9b_V4", 0x20, True),
+    ("epd13in3b", 0x20, True),
+    ("epd5in83_V2", 0x12, False),
+    ("epd5in83b_V2", 0x12, True),
+])
+def test_unlisted_drivers_are_decoded_by_controller_family(model, family, color):
+    assert model not in spi_backend.PROFILES
+    epd, emulator = run_driver(model)
+
+    assert emulator.profile["refresh"] == family
+    frame = emulator.frames[-1][2]
+    assert frame.getpixel((1, epd.height // 2)) == (0, 0, 0)
+    assert frame.getpixel((epd.width - 2, epd.height // 2)) == (255, 255, 255)
+    if color:
+        assert frame.getpixel((epd.width // 2, epd.height // 2)) == (255, 0, 0)
+
+
+def test_undecodable_traffic_is_reported(caplog):
+    # epd3in52 refreshes with 0x17, which neither controller family uses
+    _, emulator = run_driver("epd3in52")
+
+    assert emulator.frames == []
+    assert "never refreshed into a frame" in caplog.text
@@ -0,0 +1,275 @@
+import os
+import sys
+import json
+import time
+import atexit
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+
+# ✅ Span timings for every wake, as JSON lines (one object per span)
+CACHE_DIR = os.getenv("CACHE_DIR", "/mnt/photos/.epaper_cache")
+SPANS_FILE = os.getenv("SPANS_FILE", os.path.join(CACHE_DIR, "spans.jsonl"))
+SPANS_MAX_BYTES = 1024 * 1024  # Older wakes are dropped once the file grows past this
+
+# Every process started during one wake shares this id (run_update_and_display.sh exports it)
+WAKE_ID = os.getenv("WAKE_ID") or f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+PROCESS = os.path.basename(sys.argv[0]) or "python"
+
+# Spans are kept in memory and written once at exit, so timing doesn't add SD card writes to the wake
+_records = []
+_active = []  # Names of the spans currently open in any thread, oldest first
+_lock = threading.Lock()
+FLUSH_EVERY = 500  # Long-running processes (agent, display service) flush once this many spans are buffered
+_local = threading.local()
+
+
+def _uptime():
+    """Seconds since boot, so spans from different processes line up on one wake timeline."""
+    try:
+        with open("/proc/uptime") as uptime_file:
+            return float(uptime_file.read().split()[0])
+    except (OSError, ValueError):
+        return None
+
+
+def _process_started_at():
+    """Wall-clock time this process was started by the kernel (Linux only), or None."""
+    try:
+        with open("/proc/self/stat") as stat_file:
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+        started_after_boot = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return time.time() - (_uptime() - started_after_boot)
+    except (OSError, ValueError, IndexError, TypeError):
+        return None
+
+
+def record(name, started, seconds, **attrs):
+    """Record a span measured elsewhere: `started` is a time.time() timestamp."""
+    uptime = _uptime()
+    entry = {
+        "wake": WAKE_ID,
+        "name": name,
+        "start": round(started, 3),
+        "seconds": round(seconds, 4),
+        "uptime": round(uptime - (time.time() - started), 3) if uptime is not None else None,
+        "process": PROCESS,
+        "thread": threading.current_thread().name,
+    }
+    entry.update(attrs)
+    with _lock:
+        _records.append(entry)
+        buffered = len(_records)
+    if buffered >= FLUSH_EVERY:
+        flush()
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time the enclosed block as a named span (nested spans record their parent).
+
+    Calls tallied with `count` while it is the innermost span are recorded as its attributes.
+    """
+    stack = _local.__dict__.setdefault("stack", [])
+    counters = _local.__dict__.setdefault("counters", [])
+    parent = stack[-1] if stack else None
+    stack.append(name)
+    counters.append({})
+    with _lock:
+        _active.append(name)
+    started = time.time()
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        stack.pop()
+        tallies = counters.pop()
+        with _lock:
+            _active.remove(name)
+        tallies = {key: round(value, 4) for key, value in tallies.items()}
+        record(name, started, time.perf_counter() - began, parent=parent, **attrs, **tallies)
+
+
+def count(name, seconds, size=None):
+    """Tally one call of something too frequent for a span of its own (e.g. an SPI transfer) on the innermost
+    span of this thread, as `<name>_calls`, `<name>_seconds` and `<name>_bytes`. Outside any span it gets a span."""
+    counters = getattr(_local, "counters", None)
+    if not counters:
+        record(name, time.time() - seconds, seconds, bytes=size)
+        return
+    tallies = counters[-1]
+    tallies[f"{name}_calls"] = tallies.get(f"{name}_calls", 0) + 1
+    tallies[f"{name}_seconds"] = tallies.get(f"{name}_seconds", 0.0) + seconds
+    if size is not None:
+        tallies[f"{name}_bytes"] = tallies.get(f"{name}_bytes", 0) + size
+
+
+def current_phase():
+    """The most recently opened span still running in any thread, or "idle"."""
+    with _lock:
+        return _active[-1] if _active else "idle"
+
+
+def current_span():
+    """The innermost span open in the calling thread, or None."""
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else None
+
+
+def timed(name):
+    """Decorator form of `span`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def wrap(owner, attribute, name):
+    """Replace `owner.attribute` (a function or bound method) with a version timed as span `name`."""
+    func = getattr(owner, attribute)
+    if getattr(func, "_timed", False):
+        return
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(name, call=attribute):
+            return func(*args, **kwargs)
+
+    wrapper._timed = True
+    setattr(owner, attribute, wrapper)
+
+
+def wrap_counted(owner, attribute, name):
+    """Replace `owner.attribute` with a version tallied with `count` (its first argument's length is the size)."""
+    func = getattr(owner, attribute)
+    if getattr(func, "_timed", False):
+        return
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        began = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            size = len(args[0]) if args and hasattr(args[0], "__len__") else None
+            count(name, time.perf_counter() - began, size)
+
+    wrapper._timed = True
+    setattr(owner, attribute, wrapper)
+
+
+def instrument_epd(epd):
+    """Time a Waveshare driver's BUSY waits, and tally its bulk SPI transfers on the span they happen in.
+
+    Some drivers send one row per transfer, so a span each would mean thousands per refresh (and a flush
+    to the SD card in the middle of the refresh being timed).
+    """
+    for attribute in dir(epd):
+        if attribute.lower().startswith("readbusy") or attribute == "busy":
+            if callable(getattr(epd, attribute)):
+                wrap(epd, attribute, "busy_wait")
+
+    epdconfig = sys.modules.get("waveshare_epd.epdconfig")
+    if epdconfig is not None and hasattr(epdconfig, "spi_writebyte2"):
+        wrap_counted(epdconfig, "spi_writebyte2", "spi")
+
+
+def flush():
+    """Append buffered spans to SPANS_FILE (called automatically at exit)."""
+    with _lock:
+        if not _records:
+            return
+        lines = "".join(json.dumps(entry) + "\n" for entry in _records)
+        _records.clear()
+
+    try:
+        os.makedirs(os.path.dirname(SPANS_FILE), exist_ok=True)
+        with open(SPANS_FILE, "a") as spans_file:
+            spans_file.write(lines)
+        _trim()
+    except OSError as e:
+        logging.error(f"❌ Failed to write span timings: {e}")
+
+
+def _trim():
+    """Keep roughly the newest half of the file once it passes SPANS_MAX_BYTES."""
+    if os.path.getsize(SPANS_FILE) <= SPANS_MAX_BYTES:
+        return
+    with open(SPANS_FILE, "r") as spans_file:
+        spans_file.seek(os.path.getsize(SPANS_FILE) - SPANS_MAX_BYTES // 2)
+        spans_file.readline()  # Drop the partial line
+        tail = spans_file.read()
+    with open(SPANS_FILE, "w") as spans_file:
+        spans_file.write(tail)
+
+
+def load_spans():
+    """Every span on disk plus the ones still buffered in this process."""
+    spans = []
+    try:
+        with open(SPANS_FILE, "r") as spans_file:
+            for line in spans_file:
+                try:
+                    spans.append(json.loads(line))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    with _lock:
+        spans.extend(_records)
+    return spans
+
+
+def summary(wake_id=WAKE_ID, spans=None):
+    """Total seconds per span name for one wake, plus "wake_total" (first span start to last span end)."""
+    spans = [entry for entry in (spans if spans is not None else load_spans()) if entry.get("wake") == wake_id]
+    if not spans:
+        return {}
+
+    totals = {}
+    for entry in spans:
+        totals[entry["name"]] = totals.get(entry["name"], 0.0) + entry["seconds"]
+    first = min(entry["start"] for entry in spans)
+    last = max(entry["start"] + entry["seconds"] for entry in spans)
+    totals["wake_total"] = last - first
+    return {name: round(seconds, 2) for name, seconds in totals.items()}
+
+
+def previous_wake_total(spans=None):
+    """Total awake time of the last completed wake before this one, or None."""
+    spans = spans if spans is not None else load_spans()
+    wakes = [entry["wake"] for entry in spans if entry.get("wake") != WAKE_ID]
+    if not wakes:
+        return None
+    return summary(wakes[-1], spans).get("wake_total")
+
+
+def timing_sensors():
+    """MQTT sensor values for this wake's spans (so far) and the previous wake's total."""
+    spans = load_spans()
+    sensors = {f"timing_{name}": seconds for name, seconds in summary(WAKE_ID, spans).items()}
+    last_wake = previous_wake_total(spans)
+    if last_wake is not None:
+        sensors["timing_last_wake_total"] = last_wake
+    return sensors
+
+
+# The time between the kernel starting this process and this module being imported
+_started_at = _process_started_at()
+if _started_at is not None:
+    record("process_start", _started_at, time.time() - _started_at)
+
+atexit.register(flush)
+
+
+if __name__ == "__main__":
+    _records.clear()  # Don't log the report itself as a wake
+    spans = load_spans()
+    wake_id = sys.argv[1] if len(sys.argv) > 1 else (spans[-1]["wake"] if spans else WAKE_ID)
+    print(f"⏱ Wake {wake_id}")
+    for name, seconds in sorted(summary(wake_id, spans).items(), key=lambda item: -item[1]):
+        print(f"{name:24} {seconds:8.2f}s")
@@ -2,10 +2,14 @@
 import sys
 import os
 import io
+import gzip
+import hashlib
 import logging
 import time
+import timing
+from state_store import load_json_state, save_json_state
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload, MediaIoBaseUpload
 from google.oauth2 import service_account
 from dotenv import load_dotenv  # ✅ Load from .env and .secrets
 
@@ -18,7 +22,15 @@ if os.path.exists(".secrets"):
 logging.basicConfig(level=logging.INFO)
 
 LOG_FILE_NAME = "epaper_logs.txt"  # Main log file
-MAX_LOG_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_LOG_SIZE = 10 * 1024 * 1024  # 10MB, the most one wake will ship (older backlog is skipped)
+
+# ✅ Incremental shipping: where the last upload stopped, so each wake only sends new lines
+CACHE_DIR = os.getenv("CACHE_DIR", "/mnt/photos/.epaper_cache")
+SHIPPING_STATE_FILE = os.path.join(CACHE_DIR, "log_shipping.json")
+UPLOAD_CHUNK_SIZE = 256 * 1024  # Resumable uploads go in multiples of 256 KB
+UPLOAD_RETRIES = 3
+# The start of the log being shipped is fingerprinted, to find it again after rotation has gzipped it (new inode)
+HEAD_BYTES = 4096
 
 def authenticate_drive(service_account_file):
     """Authenticate Google Drive API."""
@@ -29,8 +41,11 @@ def authenticate_drive(service_account_file):
         logging.error(f"❌ Google Drive authentication failed: {e}")
         sys.exit(1)
 
-def upload_file(drive_service, file_path, folder_id):
-    """Upload a file to Google Drive."""
+def upload_file(drive_service, file_path, folder_id, http=None):
+    """Upload a file to Google Drive. Returns True on success.
+
+    `http` lets a caller running this on a worker thread pass its own connection.
+    """
     file_metadata = {
         "name": os.path.basename(file_path),
         "parents": [folder_id]
@@ -38,10 +53,138 @@ def upload_file(drive_service, file_path, folder_id):
     media = MediaFileUpload(file_path, mimetype="text/plain")
 
     try:
-        file = drive_service.files().create(body=file_metadata, media_body=media, fields="id").execute()
+        with timing.span("log_upload"):
+            file = drive_service.files().create(body=file_metadata, media_body=media, fields="id").execute(http=http)
         logging.info(f"✅ Uploaded log file to Google Drive (File ID: {file['id']})")
+        return True
     except Exception as e:
         logging.error(f"❌ Failed to upload log file: {e}")
+        return False
+
+def _read_range(path, start, end):
+    with open(path, "rb") as log_file:
+        log_file.seek(start)
+        return log_file.read(max(0, end - start))
+
+def _rotated_copies(log_path):
+    """Rotated copies of the log (see log_rotation.py), newest first: <log>.1, <log>.2.gz, <log>.3.gz, ..."""
+    paths = [f"{log_path}.1"] if os.path.exists(f"{log_path}.1") else []
+    index = 2
+    while os.path.exists(f"{log_path}.{index}.gz"):
+        paths.append(f"{log_path}.{index}.gz")
+        index += 1
+    return paths
+
+def _head_matches(data, state):
+    """True if `data` starts like the file `state` was shipping (always True for state without a fingerprint)."""
+    head_len = state.get("head_len", 0)
+    return head_len == 0 or (len(data) >= head_len and hashlib.sha1(data[:head_len]).hexdigest() == state["head"])
+
+def _is_shipped_file(path, data, state):
+    """True if `path` (contents `data`) is the file `state` was shipping: same start, and same inode unless gzipped."""
+    if not path.endswith(".gz") and os.stat(path).st_ino == state.get("inode"):
+        return _head_matches(data, state)
+    return state.get("head_len", 0) > 0 and _head_matches(data, state)
+
+def _unshipped_rotated_lines(log_path, state):
+    """Return the unshipped parts of the rotated copies, oldest first.
+
+    The log may have rotated more than once since the last upload, so the copies are walked back to the
+    file that was being shipped; everything after its shipped offset is unshipped. If that file has
+    already been pruned, every copy is unshipped and whatever was in between is lost.
+    """
+    newer = []
+    for path in _rotated_copies(log_path):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rb") as rotated_file:
+            data = rotated_file.read()
+        if _is_shipped_file(path, data, state):
+            return [data[state.get("offset", 0):]] + newer[::-1]
+        newer.append(data)
+
+    if state.get("head_len", 0) > 0:
+        logging.warning(f"⚠ Log rotated past the last upload; lines between it and {len(newer)} kept copies are lost")
+        return newer[::-1]
+    logging.warning("⚠ Log rotated since the last upload; its unshipped lines could not be found and are skipped")
+    return []
+
+def new_log_segment(log_path, state):
+    """Return (bytes added since `state`, state to save once they are shipped).
+
+    Only whole lines are shipped; a trailing partial line waits for the next wake. If the log was
+    rotated since the last upload, the unshipped lines of the rotated copies come first.
+    """
+    stat = os.stat(log_path)
+    inode, offset = state.get("inode"), state.get("offset", 0)
+    parts = []
+
+    # Inodes get reused, so a new log can have the old one's inode: the fingerprint tells them apart
+    rotated = inode is not None and (
+        inode != stat.st_ino or not _head_matches(_read_range(log_path, 0, state.get("head_len", 0)), state)
+    )
+    if rotated:
+        parts.extend(_unshipped_rotated_lines(log_path, state))
+        offset = 0
+    elif stat.st_size < offset:
+        offset = 0  # Truncated in place: start over
+
+    # Never ship more than MAX_LOG_SIZE in one wake
+    start = max(offset, stat.st_size - MAX_LOG_SIZE)
+    if start > offset:
+        logging.warning(f"⚠ Skipping {(start - offset) / 1024:.0f} KB of unshipped log backlog")
+    data = _read_range(log_path, start, stat.st_size)
+    complete = data.rfind(b"\n") + 1
+    parts.append(data[:complete])
+
+    segment = b"".join(parts)
+    if len(segment) > MAX_LOG_SIZE:
+        logging.warning(f"⚠ Skipping {(len(segment) - MAX_LOG_SIZE) / 1024:.0f} KB of unshipped log backlog")
+        segment = segment[-MAX_LOG_SIZE:]
+
+    head = _read_range(log_path, 0, min(HEAD_BYTES, stat.st_size))
+    next_state = {"inode": stat.st_ino, "offset": start + complete,
+                  "head": hashlib.sha1(head).hexdigest(), "head_len": len(head)}
+    return segment, next_state
+
+def upload_segment(drive_service, name, data, folder_id, http=None):
+    """Upload bytes as a new gzip file in Drive with a resumable upload. Returns the file id."""
+    media = MediaIoBaseUpload(io.BytesIO(data), mimetype="application/gzip", chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+    request = drive_service.files().create(body={"name": name, "parents": [folder_id]}, media_body=media, fields="id")
+
+    response = None
+    while response is None:
+        _, response = request.next_chunk(http=http, num_retries=UPLOAD_RETRIES)
+    return response["id"]
+
+def ship_log(drive_service, log_path, folder_id, http=None):
+    """Upload only the log lines written since the last successful upload, gzip-compressed. Returns True on success."""
+    state = load_json_state(SHIPPING_STATE_FILE, {})
+    try:
+        segment, next_state = new_log_segment(log_path, state)
+    except OSError as e:
+        logging.error(f"❌ Failed to read log file: {e}")
+        return False
+
+    if not segment:
+        logging.info("ℹ️ No new log lines to upload.")
+        save_json_state(SHIPPING_STATE_FILE, next_state)
+        return True
+
+    compressed = gzip.compress(segment)
+    name = f"{os.path.splitext(os.path.basename(log_path))[0]}_{time.strftime('%Y%m%d-%H%M%S')}.log.gz"
+    try:
+        with timing.span("log_upload", bytes=len(compressed)):
+            file_id = upload_segment(drive_service, name, compressed, folder_id, http)
+    except Exception as e:
+        logging.error(f"❌ Failed to upload log segment: {e}")
+        return False
+
+    save_json_state(SHIPPING_STATE_FILE, next_state)
+    logging.info(
+        f"✅ Uploaded {len(segment) / 1024:.1f} KB of new log lines as {name} "
+        f"({len(compressed) / 1024:.1f} KB gzipped, File ID: {file_id})"
+    )
+    return True
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -64,5 +207,8 @@ if __name__ == "__main__":
 
     drive_service = authenticate_drive(SERVICE_ACCOUNT_FILE)
 
-    # Upload the log file
-    upload_file(drive_service, local_log_path, DRIVE_LOGS_FOLDER_ID)
+    # Ship what was logged since the last upload (--full re-uploads the whole file as before)
+    if "--full" in sys.argv:
+        upload_file(drive_service, local_log_path, DRIVE_LOGS_FOLDER_ID)
+    else:
+        ship_log(drive_service, local_log_path, DRIVE_LOGS_FOLDER_ID)
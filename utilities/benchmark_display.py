@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Throughput benchmark of the display pipeline (preprocess, pack, refresh) on the headless emulator.
+
+Renders each image from a directory N times through display.render() and reports frames per second.
+No MQTT updates are published, so a slow or unreachable broker doesn't count against the pipeline.
+Usage: python3 utilities/benchmark_display.py <image_dir> [rounds] [--display epd5in65f]
+Set EMULATOR_SINK=png:/tmp/frames (or strip:/tmp/frames.gif) to keep the rendered frames.
+"""
+import os
+import sys
+import time
+import argparse
+
+# Headless emulator on the instant clock unless the caller asked otherwise; set before config is imported
+os.environ.setdefault("USE_SIMULATOR", "true")
+os.environ.setdefault("EMULATOR_HEADLESS", "true")
+os.environ.setdefault("EMULATOR_CLOCK_SPEED", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import display
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput benchmark of the display pipeline on the headless emulator")
+    parser.add_argument("image_dir", help="Directory of images to render")
+    parser.add_argument("rounds", nargs="?", type=int, default=3, help="Times to render each image (default 3)")
+    # Read by config.py; declared here so their values aren't taken for image_dir or rounds
+    parser.add_argument("--display", help="ePaper display model, e.g. epd5in65f")
+    parser.add_argument("--source", help="Image source (local or drive)")
+    args, _ = parser.parse_known_args()
+    image_dir, rounds = args.image_dir, args.rounds
+
+    images = sorted(os.path.join(image_dir, name) for name in os.listdir(image_dir)
+                    if name.lower().endswith(IMAGE_EXTENSIONS))
+    if not images:
+        print(f"❌ No images in {image_dir}")
+        sys.exit(1)
+
+    # First render creates the emulator; keep it out of the measurement
+    started = time.perf_counter()
+    display.render(images[0], os.path.basename(images[0]), publish=False)
+    print(f"⏱ Startup + first frame: {time.perf_counter() - started:.3f}s")
+
+    started = time.perf_counter()
+    frames = 0
+    for _ in range(rounds):
+        for path in images:
+            if display.render(path, os.path.basename(path), publish=False):
+                frames += 1
+    elapsed = time.perf_counter() - started
+
+    display.emulator.frame_sink.close()
+    print(f"🏁 {frames} frames in {elapsed:.3f}s: {frames / elapsed:.2f} frames/s, "
+          f"{elapsed / frames * 1000:.1f} ms/frame")
+    print(f"🕰 Emulated panel time skipped: {display.emulator.clock.skipped:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Stand-in for pisugar-server, for running the frame's PiSugar code on a machine without one.
+
+Answers "get <key>" with canned values and acknowledges set/rtc commands, one line per request.
+Usage: python3 utilities/fake_pisugar_server.py [port] [delay_ms]
+"""
+import sys
+import time
+import socket
+import logging
+import socketserver
+from datetime import datetime
+
+logging.basicConfig(level=logging.INFO)
+
+VALUES = {
+    "firmware_version": "1.2.3",
+    "battery": "87.5",
+    "battery_i": "0.21",
+    "battery_v": "4.05",
+    "battery_charging": "false",
+    "model": "PiSugar 3",
+    "battery_led_amount": "4",
+    "battery_power_plugged": "false",
+    "battery_charging_range": "80,100",
+    "battery_allow_charging": "true",
+    "battery_output_enabled": "true",
+    "rtc_alarm_enabled": "true",
+    "rtc_alarm_time": "2000-01-01T08:00:00+00:00",
+    "alarm_repeat": "127",
+    "safe_shutdown_level": "3",
+    "safe_shutdown_delay": "30",
+    "auth_username": "",
+    "anti_mistouch": "true",
+    "soft_poweroff": "false",
+    "temperature": "38",
+}
+
+# Simulated per-request processing time, like the real server's I2C round trip
+DELAY = 0.0
+
+
+def respond(request):
+    parts = request.split()
+    if not parts:
+        return None
+    if parts[0] == "get" and len(parts) == 2:
+        if parts[1] == "rtc_time":
+            return f"rtc_time: {datetime.now().astimezone().isoformat(timespec='seconds')}"
+        if parts[1] in VALUES:
+            return f"{parts[1]}: {VALUES[parts[1]]}"
+    elif parts[0] in ("rtc_web", "rtc_pi2rtc", "rtc_alarm_set") or parts[0].startswith("set_"):
+        return f"{parts[0]}: done"
+    return "Invalid request."
+
+
+class PiSugarHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        for line in self.rfile:
+            response = respond(line.decode("utf-8").strip())
+            if response is None:
+                continue
+            time.sleep(DELAY)
+            self.wfile.write(f"{response}\n".encode("utf-8"))
+
+
+class PiSugarServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8423
+    DELAY = int(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.0
+
+    with PiSugarServer(("127.0.0.1", port), PiSugarHandler) as server:
+        logging.info(f"🔋 Fake PiSugar server listening on 127.0.0.1:{port}")
+        server.serve_forever()
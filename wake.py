@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# One wake of the frame in a single process: set the next alarm, show an image, report, then power off.
+# The work after the refresh (telemetry, log upload, panel sleep, OTA check) runs side by side, and the Pi
+# shuts down as soon as all of it has finished instead of after a fixed delay.
+import os
+import time
+import logging
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait
+import timing
+import energy
+
+# Battery draw is sampled for the whole wake: from here, before the heavy imports, until the tail has finished
+wake_started = time.time()
+wake_sampler = energy.EnergySampler()
+wake_sampler.start()
+
+import wake_log
+import log_rotation
+import display
+import mqtt_update
+import upload_to_drive
+from config import CONFIG
+from pisugar import set_wake_alarm
+from drive_session import get_drive_session
+from ota_update import check_for_update
+
+# ✅ Minutes until the PiSugar RTC wakes the frame again
+WAKE_INTERVAL_MINUTES = int(os.getenv("WAKE_INTERVAL_MINUTES", 480))
+
+# Upper bound on the post-refresh work, so a stuck upload can't keep the Pi awake
+TAIL_TIMEOUT = 120
+
+# Set once the panel has finished refreshing and the energy used up to then is recorded
+refreshed = threading.Event()
+
+def run_step(name, func, *args):
+    """Run one step in a span, logging (not raising) its failure. Returns its result, or None."""
+    try:
+        with timing.span(name):
+            return func(*args)
+    except Exception as e:
+        logging.error(f"❌ {name} failed: {e}")
+        return None
+
+
+def show_image():
+    """Pick the next image and start the panel refresh. Returns True once the refresh is under way."""
+    image_data, image_title = display.select_image(CONFIG["IMAGE_PATH"])
+    if image_data is None:
+        print("❌ No image to display.")
+        return False
+    return display.render(image_data, image_title, wait=False)
+
+
+def finish_refresh():
+    """Wait out the panel's refresh (the driver's final BUSY wait), then record the energy used up to its end."""
+    try:
+        return display.wait_for_refresh()
+    finally:
+        # The whole wake is recorded at the end; this part is published with this wake's telemetry
+        energy.record_report("refresh", wake_started, wake_sampler.report())
+        refreshed.set()
+
+
+def publish_telemetry():
+    """Publish PiSugar status plus this wake's timing and energy over one MQTT connection.
+
+    The PiSugar is read while the panel refreshes; publishing waits for the refresh, so its timing and energy go out too.
+    """
+    status = mqtt_update.get_pisugar_status()
+    refreshed.wait(TAIL_TIMEOUT)
+    mqtt_update.publish_status({**status, **timing.timing_sensors(), **energy.energy_sensors()})
+    return True
+
+
+def upload_log():
+    """Ship new log lines on their own connection (httplib2 connections can't be shared across threads)."""
+    folder_id = os.getenv("GOOGLE_DRIVE_LOG_FOLDER_ID")
+    if not folder_id:
+        logging.warning("⚠ GOOGLE_DRIVE_LOG_FOLDER_ID is not set. Skipping log upload.")
+        return False
+
+    wake_log.flush()  # So this wake's lines so far go out now rather than with the next wake
+    session = get_drive_session()
+    return upload_to_drive.ship_log(session.service, CONFIG["LOG_FILE"], folder_id, http=session.new_http())
+
+
+def sleep_panel():
+    """Put the panel into deep sleep (Waveshare drivers spend ~2.5s in delays here)."""
+    display.sleep_panel()
+    return True
+
+
+def finish_panel():
+    """Wait for the refresh, then put the panel to sleep, each in its own span."""
+    run_step("refresh_wait", finish_refresh)
+    return run_step("panel_sleep", sleep_panel)
+
+
+def shutdown():
+    """Power off right away, unless disabled or someone is logged in over SSH."""
+    if not CONFIG["SHUTDOWN_AFTER_RUN"]:
+        print("🟢 SHUTDOWN_AFTER_RUN is disabled. Display will remain on.")
+        return
+    if display.check_ssh_sessions():
+        print("🚨 Active SSH session detected! Preventing shutdown.")
+        return
+
+    # The power is about to go; write what atexit would otherwise write
+    print("⏻ Shutting down now.")
+    timing.flush()
+    wake_log.flush()
+    subprocess.call(["sudo", "shutdown", "-h", "now"])
+
+
+def follow_rotated_log(path):
+    """Point stdout/stderr at the new log if they were appending to the copy just rotated to `<log>.1`.
+
+    run_update_and_display.sh opens the log for our output before the wake rotates it.
+    """
+    try:
+        rotated = os.stat(f"{path}.1")
+    except FileNotFoundError:
+        return
+    new_log = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    for fd in (1, 2):
+        stat = os.fstat(fd)
+        if (stat.st_dev, stat.st_ino) == (rotated.st_dev, rotated.st_ino):
+            os.dup2(new_log, fd)
+    os.close(new_log)
+
+
+def main():
+    # Rotate the log once it gets large, before anything opens it for this wake
+    if log_rotation.rotate_log(CONFIG["LOG_FILE"]):
+        follow_rotated_log(CONFIG["LOG_FILE"])
+    # Everything printed or logged from here on is buffered and written to the log in one go at the end
+    wake_log.setup(CONFIG["LOG_FILE"])
+    executor = ThreadPoolExecutor(max_workers=5, thread_name_prefix="wake")
+
+    # Setting the next alarm waits on an RTC web sync; let it happen while the image is prepared
+    alarm = executor.submit(run_step, "wake_alarm", set_wake_alarm, WAKE_INTERVAL_MINUTES)
+
+    shown = run_step("display", show_image)
+    print(f"{'✅' if shown else '❌'} Display step finished; the panel refreshes while the rest of the wake runs.")
+
+    # Everything after the refresh command is independent: run it side by side, overlapping the panel's BUSY wait.
+    # The OTA check only goes to the network every OTA_CHECK_HOURS, and never delays the refresh.
+    tail = [
+        executor.submit(run_step, "telemetry", publish_telemetry),
+        executor.submit(run_step, "log_shipping", upload_log),
+        executor.submit(finish_panel),
+        executor.submit(run_step, "ota_update", check_for_update),
+    ]
+    _, pending = wait(tail + [alarm], timeout=TAIL_TIMEOUT)
+    if pending:
+        logging.warning(f"⚠ {len(pending)} wake tasks still running after {TAIL_TIMEOUT}s. Shutting down anyway.")
+
+    energy.record_report("wake", wake_started, wake_sampler.stop())
+    shutdown()
+    executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main()
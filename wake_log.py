@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import atexit
+import signal
+import logging
+import argparse
+import threading
+import timing
+
+# ✅ Structured wake log: JSON lines kept in memory and appended to LOG_FILE in one write at exit
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()  # DEBUG, INFO, WARNING, ERROR
+LOG_BUFFER_BYTES = 512 * 1024  # A runaway wake flushes early instead of growing without bound
+
+LEVEL_ORDER = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+
+
+class BufferedJSONHandler(logging.Handler):
+    """Logging handler that formats records as JSON lines and holds them until `flush`."""
+
+    def __init__(self, path, level=LOG_LEVEL):
+        super().__init__(level)
+        self.path = path
+        self.lines = []
+        self.buffered = 0
+
+    def emit(self, record):
+        try:
+            entry = {
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+                "level": record.levelname,
+                "wake": timing.WAKE_ID,
+                "phase": timing.current_span(),
+                "source": record.name,
+                "msg": record.getMessage(),
+            }
+            if record.exc_info:
+                entry["exc"] = logging.Formatter().formatException(record.exc_info)
+            line = json.dumps(entry, ensure_ascii=False) + "\n"
+        except Exception:
+            self.handleError(record)
+            return
+
+        with self.lock:
+            self.lines.append(line)
+            self.buffered += len(line)
+            full = self.buffered >= LOG_BUFFER_BYTES
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Append everything buffered to the log file in a single write."""
+        with self.lock:
+            if not self.lines:
+                return
+            data, self.lines, self.buffered = "".join(self.lines), [], 0
+        try:
+            with open(self.path, "a", encoding="utf-8") as log_file:
+                log_file.write(data)
+        except OSError as e:
+            sys.__stderr__.write(f"❌ Failed to write log {self.path}: {e}\n{data}")
+
+
+class _PrintToLog:
+    """File-like stand-in for stdout/stderr that turns each printed line into a log record."""
+
+    def __init__(self, logger, level, echo=None):
+        self.logger = logger
+        self.level = level
+        self.echo = echo  # The original stream when it is a terminal, so interactive runs still show output
+        self.partial = threading.local()
+
+    def write(self, text):
+        if self.echo:
+            self.echo.write(text)
+        pending = getattr(self.partial, "text", "") + text
+        *lines, self.partial.text = pending.split("\n")
+        for line in lines:
+            if line.strip():
+                self.logger.log(self.level, line.rstrip())
+        return len(text)
+
+    def flush(self):
+        if self.echo:
+            self.echo.flush()
+
+    def isatty(self):
+        return bool(self.echo)
+
+
+_handler = None
+
+
+def setup(path, level=LOG_LEVEL, capture_prints=True):
+    """Send logging (and, by default, print output) to a buffered JSON-lines log at `path`.
+
+    Records below `level` are dropped before they are formatted. The buffer is written
+    once at exit, including after an uncaught exception or SIGTERM; call `flush` before
+    powering off. Returns the handler.
+    """
+    global _handler
+    if _handler is not None:
+        return _handler
+
+    _handler = BufferedJSONHandler(path, level)
+    root = logging.getLogger()
+    for existing in list(root.handlers):  # Drop the console handlers left by basicConfig
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+    root.setLevel(level)
+
+    if capture_prints:
+        sys.stdout = _PrintToLog(logging.getLogger("stdout"), logging.INFO, sys.__stdout__ if sys.__stdout__.isatty() else None)
+        sys.stderr = _PrintToLog(logging.getLogger("stderr"), logging.ERROR, sys.__stderr__ if sys.__stderr__.isatty() else None)
+
+    # A crash is logged with its traceback before the exit-time flush writes it out
+    def log_crash(exc_type, exc, tb):
+        logging.critical("💥 Uncaught exception", exc_info=(exc_type, exc, tb))
+    sys.excepthook = log_crash
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+
+    atexit.register(flush)
+    return _handler
+
+
+def flush():
+    """Write out everything logged so far."""
+    if _handler is not None:
+        _handler.flush()
+
+
+def read_log(path, wake_id=None, level=None, phase=None):
+    """Yield the JSON records in a log file, filtered by wake, minimum level and phase (plain lines are skipped)."""
+    minimum = LEVEL_ORDER.index(level.upper()) if level else 0
+    with open(path, "r", encoding="utf-8", errors="replace") as log_file:
+        for line in log_file:
+            if not line.startswith("{"):
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if wake_id and entry.get("wake") != wake_id:
+                continue
+            if entry.get("level") in LEVEL_ORDER and LEVEL_ORDER.index(entry["level"]) < minimum:
+                continue
+            if phase and entry.get("phase") != phase:
+                continue
+            yield entry
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the structured wake log")
+    parser.add_argument("log", nargs="?", default=os.getenv("LOG_FILE", "/mnt/photos/epaper_logs.txt"))
+    parser.add_argument("--wake", help="Only this wake id (default: all)")
+    parser.add_argument("--level", help="Minimum level, e.g. WARNING")
+    parser.add_argument("--phase", help="Only lines logged inside this span, e.g. download")
+    args = parser.parse_args()
+
+    for entry in read_log(args.log, args.wake, args.level, args.phase):
+        phase = f" [{entry['phase']}]" if entry.get("phase") else ""
+        print(f"{entry['time']} {entry['level']:<8} {entry['wake']}{phase} {entry['msg']}")
+        if entry.get("exc"):
+            print(entry["exc"])